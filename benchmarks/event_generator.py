@@ -0,0 +1,102 @@
+"""
+Benchmark generating the event stream for deeply nested queries, comparing
+the explicit stack walk in djangosearch.query with the recursive generator it
+replaced, which re-yielded every event through each level of nesting.
+
+Run from the root of the checkout::
+
+    python benchmarks/event_generator.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from django.conf import settings
+if not settings.configured:
+    settings.configure(DATABASE_ENGINE='sqlite3')
+
+from djangosearch.query import *
+from djangosearch.query import _event_generator
+
+def recursive_event_generator(node):
+    if isinstance(node, Term):
+        yield (TERM, node.text)
+    elif isinstance(node, And):
+        for child in node.children:
+            for event in recursive_event_generator(child):
+                yield event
+    elif isinstance(node, Or):
+        for child in node.children[:-1]:
+            yield (START, 'or')
+            if isinstance(child, And):
+                child = Group(child)
+            for event in recursive_event_generator(child):
+                yield event
+        for event in recursive_event_generator(node.children[-1]):
+            yield event
+        for child in node.children[:-1]:
+            yield (END, 'or')
+    elif isinstance(node, Phrase):
+        yield (START, 'quotes')
+        for term in node.terms:
+            yield (TERM, term)
+        yield (END, 'quotes')
+    elif isinstance(node, Field):
+        yield (START, 'field')
+        yield (START, 'fieldname')
+        yield (TERM, node.name)
+        yield (END, 'fieldname')
+        for event in recursive_event_generator(node.value):
+            yield event
+        yield (END, 'field')
+    else:
+        name = isinstance(node, Not) and 'not' or 'group'
+        yield (START, name)
+        for event in recursive_event_generator(node.child):
+            yield event
+        yield (END, name)
+
+def nested_groups(depth):
+    """(((a b) a b) a b)..."""
+    node = And((Term('a'), Term('b')))
+    for i in range(depth):
+        node = And((Group(node), Term('a'), Term('b')))
+    return node
+
+def or_chain(length):
+    """a or a or a ..., as parsed."""
+    node = Term('a')
+    for i in range(length):
+        node = Or((Term('a'), node))
+    return node
+
+TREES = [
+    ("groups", nested_groups),
+    ("or chain", or_chain),
+]
+
+def events_per_second(generator, tree):
+    timer = timeit.Timer(lambda: list(generator(tree)))
+    number = 20
+    events = len(list(_event_generator(tree)))
+    return events * number / min(timer.repeat(repeat=3, number=number))
+
+def main():
+    print "%-10s %6s %16s %16s" % ("tree", "depth", "recursive ev/s",
+                                   "stack ev/s")
+    for name, make_tree in TREES:
+        for depth in (10, 100, 300, 2000):
+            tree = make_tree(depth)
+            try:
+                recursive = "%16d" % events_per_second(
+                    recursive_event_generator, tree)
+            except RuntimeError:
+                recursive = "%16s" % "recursion limit"
+            print "%-10s %6d %s %16d" % (name, depth, recursive,
+                    events_per_second(_event_generator, tree))
+
+if __name__ == '__main__':
+    main()
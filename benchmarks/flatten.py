@@ -0,0 +1,84 @@
+"""
+Benchmark ModelIndex.flatten(), comparing looking for the index template for
+every object, as it used to, with looking once per model.
+
+Two models are flattened: one with an index template and one without, which
+falls back to the ``text`` fields. No database is needed.
+
+Run from the root of the checkout::
+
+    python benchmarks/flatten.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+TEMPLATE_DIR = tempfile.mkdtemp()
+
+from django.conf import settings
+if not settings.configured and 'DJANGO_SETTINGS_MODULE' not in os.environ:
+    settings.configure(TEMPLATE_DIRS=[TEMPLATE_DIR],
+                       INSTALLED_APPS=['djangosearch'])
+
+from django.db import models
+from djangosearch import ModelIndex
+
+OBJECTS = 2000
+
+def make_model(name):
+    attrs = {
+        '__module__': __name__,
+        'Meta': type('Meta', (), {'app_label': 'flatten_benchmark'}),
+        'title': models.CharField(max_length=255),
+        'body': models.TextField(),
+        'index': ModelIndex(text=['title', 'body']),
+    }
+    model = type(name, (models.Model,), attrs)
+    # Flatten without a search engine.
+    model.index._engine = False
+    return model
+
+def write_template(model):
+    opts = model._meta
+    directory = os.path.join(TEMPLATE_DIR, opts.app_label)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    f = open(os.path.join(directory, '%s_index.txt' % opts.module_name), 'w')
+    f.write('{{ object.title }}\n{{ object.body }}\n')
+    f.close()
+
+def uncached(index, objects):
+    for obj in objects:
+        index.clear_template_cache()
+        index.flatten(obj)
+
+def cached(index, objects):
+    index.clear_template_cache()
+    for obj in objects:
+        index.flatten(obj)
+
+def per_second(func, *args):
+    best = min(timeit.Timer(lambda: func(*args)).repeat(repeat=3, number=1))
+    return OBJECTS / best
+
+def main():
+    templated, plain = make_model('Templated'), make_model('Plain')
+    write_template(templated)
+    try:
+        print "%-12s %14s %14s" % ("template", "uncached", "cached")
+        for model, label in ((templated, "yes"), (plain, "no")):
+            objects = [model(pk=i, title='title %d' % i, body='body ' * 50)
+                       for i in range(OBJECTS)]
+            timings = [per_second(func, model.index, objects)
+                       for func in (uncached, cached)]
+            print "%-12s %10d/sec %10d/sec" % tuple([label] + timings)
+    finally:
+        shutil.rmtree(TEMPLATE_DIR)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark loading a page of search results spread across a number of models,
+comparing one in_bulk() after another with SEARCH_CONCURRENT_LOADING.
+
+By default this uses a temporary SQLite database, which has no network round
+trips to overlap, so the numbers are most interesting when run against a
+real database server by pointing DJANGO_SETTINGS_MODULE at its settings. The
+benchmark creates and drops its own tables.
+
+Run from the root of the checkout::
+
+    python benchmarks/hydration.py
+"""
+
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from django.conf import settings
+if not settings.configured and 'DJANGO_SETTINGS_MODULE' not in os.environ:
+    settings.configure(DATABASE_ENGINE='sqlite3',
+                       DATABASE_NAME=tempfile.mktemp(suffix='.db'))
+
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from djangosearch import results
+
+MAX_MODELS = 6
+PAGE_SIZE = 60
+ROWS = 1000
+
+def make_model(i):
+    attrs = {
+        '__module__': __name__,
+        'Meta': type('Meta', (), {'app_label': 'hydration_benchmark'}),
+        'title': models.CharField(max_length=255),
+        'body': models.TextField(),
+    }
+    return type('Model%d' % i, (models.Model,), attrs)
+
+def create_tables(model_classes):
+    cursor = connection.cursor()
+    for model in model_classes:
+        sql, references = connection.creation.sql_create_model(model,
+                                                                no_style())
+        for statement in sql:
+            cursor.execute(statement)
+        for i in range(ROWS):
+            model.objects.create(title='title %d' % i, body='body ' * 50)
+    transaction.commit_unless_managed()
+
+def drop_tables(model_classes):
+    cursor = connection.cursor()
+    for model in model_classes:
+        cursor.execute('DROP TABLE %s'
+                       % connection.ops.quote_name(model._meta.db_table))
+    transaction.commit_unless_managed()
+
+def page(model_classes):
+    """
+    The primary keys of a page of results taking turns between the models,
+    grouped by model.
+    """
+    model_pks = {}
+    for i in range(PAGE_SIZE):
+        model = model_classes[i % len(model_classes)]
+        model_pks.setdefault(model, []).append(i * 7 % ROWS + 1)
+    return model_pks
+
+def serial(model_pks, get_query_set):
+    return dict([(model, get_query_set(model).in_bulk(pks))
+                 for model, pks in model_pks.items()])
+
+def best_of(func, number=20):
+    return min(timeit.Timer(func).repeat(repeat=3, number=number)) / number
+
+def main():
+    model_classes = [make_model(i) for i in range(MAX_MODELS)]
+    create_tables(model_classes)
+    get_query_set = lambda model: model._default_manager.all()
+    try:
+        print "%-8s %12s %12s" % ("models", "serial", "concurrent")
+        for n in range(1, MAX_MODELS + 1):
+            model_pks = page(model_classes[:n])
+            timings = []
+            for load in (serial, results._in_bulk_concurrently):
+                loaded = load(model_pks, get_query_set)
+                assert sum(map(len, loaded.values())) == PAGE_SIZE
+                timings.append(best_of(lambda: load(model_pks, 
+                                                    get_query_set)) * 1000)
+            print "%-8d %10.2fms %10.2fms" % tuple([n] + timings)
+    finally:
+        drop_tables(model_classes)
+        if settings.DATABASE_ENGINE == 'sqlite3':
+            connection.close()
+            os.remove(settings.DATABASE_NAME)
+
+if __name__ == '__main__':
+    main()
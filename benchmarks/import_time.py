@@ -0,0 +1,53 @@
+"""
+Track how long ``import djangosearch`` takes, and how long it then takes to
+load the configured search backend, each in a fresh interpreter. Django's own
+modules are imported first, since their cost isn't ours to cut.
+
+Run from the root of the checkout::
+
+    python benchmarks/import_time.py [SEARCH_ENGINE]
+
+The search engine defaults to solr.
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+SCRIPT = """
+import sys, time
+sys.path.insert(0, %(root)r)
+from django.conf import settings
+settings.configure(DATABASE_ENGINE='sqlite3', SEARCH_ENGINE=%(engine)r,
+                   SOLR_URL='http://localhost:8983/solr/')
+import django.db.models, django.template.loader
+start = time.time()
+import djangosearch
+middle = time.time()
+import djangosearch.backends
+end = time.time()
+print middle - start, end - middle
+"""
+
+RUNS = 20
+
+def main():
+    engine = len(sys.argv) > 1 and sys.argv[1] or 'solr'
+    script = SCRIPT % {'root': ROOT, 'engine': engine}
+    package_times, backend_times = [], []
+    for i in range(RUNS):
+        output = subprocess.Popen([sys.executable, '-c', script],
+                                  stdout=subprocess.PIPE).communicate()[0]
+        package_time, backend_time = [float(t) for t in output.split()]
+        package_times.append(package_time)
+        backend_times.append(backend_time)
+    print "%-24s %10s %10s" % ("", "min", "mean")
+    for name, times in (("import djangosearch", package_times),
+                        ("load %s backend" % engine, backend_times)):
+        print "%-24s %8.2fms %8.2fms" % (name, min(times) * 1000,
+                                         sum(times) / len(times) * 1000)
+
+if __name__ == '__main__':
+    main()
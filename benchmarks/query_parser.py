@@ -0,0 +1,67 @@
+"""
+Benchmark the hand-written query parser against the original pyparsing
+grammar it replaced, with and without pyparsing's packrat memoization. The
+memo entries column is the size of the packrat memo table after parsing the
+query, as a measure of its memory cost.
+
+Run from the root of the checkout::
+
+    python benchmarks/query_parser.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from django.conf import settings
+if not settings.configured:
+    settings.configure(DATABASE_ENGINE='sqlite3')
+
+from djangosearch import pyparsing, query
+
+# The pyparsing grammar backtracks exponentially on the last two, so they are
+# kept small enough to finish.
+QUERIES = [
+    ("short", 'django', 200),
+    ("typical", '(video or pictures) -(sports news) "train times" foo '
+                '-boring title:foo', 200),
+    ("long", ' '.join(['term%d' % i for i in range(100)]), 50),
+    ("many ors", ' or '.join(['term%d' % i for i in range(50)]), 50),
+    ("nested", '(' * 8 + 'a or b' + ')' * 8, 5),
+    ("unclosed", 'a or ' * 10 + '(' * 6 + 'b', 5),
+]
+
+def best_of(func, arg, number):
+    timer = timeit.Timer(lambda: func(arg))
+    return min(timer.repeat(repeat=3, number=number)) / number
+
+def main():
+    parser = query._make_parser()
+    new = lambda q: list(query._event_generator(parser(q)))
+    old = query._make_pyparsing_parser()
+    results = {}
+    for name, q, number in QUERIES:
+        assert old(q) == new(q), "parsers disagree on %r" % q
+        results[name] = [best_of(old, q, number), best_of(new, q, number)]
+
+    # Packrat parsing can't be turned off again once it is on, so it has to
+    # be measured last.
+    packrat = query._make_pyparsing_parser(packrat=True)
+    memo = pyparsing.ParserElement._exprArgCache
+    for name, q, number in QUERIES:
+        assert packrat(q) == new(q), "packrat parser disagrees on %r" % q
+        results[name].append(best_of(packrat, q, number))
+        results[name].append(len(memo))
+
+    print "%-10s %12s %12s %12s %8s %13s" % ("query", "pyparsing",
+            "packrat", "hand-written", "speedup", "memo entries")
+    for name, q, number in QUERIES:
+        old_time, new_time, packrat_time, memo_size = results[name]
+        print "%-10s %10.1fus %10.1fus %10.1fus %7.1fx %13d" % (name,
+                old_time * 1e6, packrat_time * 1e6, new_time * 1e6,
+                old_time / new_time, memo_size)
+
+if __name__ == '__main__':
+    main()
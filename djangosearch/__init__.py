@@ -5,7 +5,7 @@ Object search engine for Django
 from djangosearch.indexer import ModelIndex
 from djangosearch.results import SearchResults
 
-__all__ = ['search', 'ModelIndex']
+__all__ = ['search', 'asearch', 'ModelIndex']
 
 
 def search(query, models=None):
@@ -26,3 +26,19 @@ def search(query, models=None):
     # after importing search, but before we use it.
     from djangosearch.backends import backend
     return backend.search(query, models)
+
+def asearch(query, models=None):
+    """
+    Like search(), but starts fetching the first results from the search 
+    engine in the background straight away, so the request can get on with
+    other things (such as other searches) in the meantime.
+    
+    With a database engine backend, this is the same as search().
+    """
+    from djangosearch.backends import backend
+    return _prefetch(backend.search(query, models))
+
+def _prefetch(results):
+    if isinstance(results, SearchResults):
+        results.prefetch()
+    return results
@@ -4,17 +4,37 @@ from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.utils.encoding import force_unicode
 
-from djangosearch.query import SearchQuery
+from djangosearch.query import SearchQuery, check_query
 from djangosearch.results import SearchResults
 
-__all__ = ['backend', 'BaseSearchEngine', 'search']
+__all__ = ['backend', 'BaseSearchEngine', 'get_engine', 'search']
 
 def search(query, models=None):
     """
     Returns a SearchResults object containing the results.
+
+    Raises QueryTooComplex straight away if the query is over the limits set
+    by the ``SEARCH_MAX_QUERY_*`` settings, rather than when the results are
+    first used.
     """
+    check_query(query)
     return SearchResults(SearchQuery(query, models))
 
+_engine = None
+
+def get_engine():
+    """
+    Returns the backend's SearchEngine. One is shared by all searches and
+    indexes, so engines must be safe to use from several threads at once.
+    
+    Raises AttributeError for database engine backends, which don't have
+    one.
+    """
+    global _engine
+    if _engine is None:
+        _engine = backend.SearchEngine()
+    return _engine
+
 class BaseSearchEngine(object):
     """
     Abstract search engine base class.
@@ -22,6 +42,11 @@ class BaseSearchEngine(object):
     def get_results(self, query):
         """
         Override with a method to get results for a SearchResults object.
+
+        Returns a list of djangosearch.results.Hit objects. If 
+        ``query.fields`` is a list of field names, each hit should also have
+        a ``fields`` dictionary with the values of those fields stored in the
+        index.
         """
         raise NotImplementedError
 
@@ -32,12 +57,44 @@ class BaseSearchEngine(object):
         """
         raise NotImplementedError
 
+    def get_approximate_count(self, query):
+        """
+        Override with a method to estimate the number of results, if that is
+        quicker than get_count().
+        """
+        return self.get_count(query)
+
+    def get_results_async(self, query):
+        """
+        Returns a djangosearch.background.Future for get_results(). By 
+        default, get_results() is called in a background thread; engines
+        with a client that doesn't block can override this.
+        """
+        from djangosearch import background
+        return background.submit(self.get_results, query)
+
+    def get_count_async(self, query):
+        """
+        Returns a djangosearch.background.Future for get_count(), like
+        get_results_async().
+        """
+        from djangosearch import background
+        return background.submit(self.get_count, query)
+
     def update(self, indexer, iterable):
         pass
 
     def remove(self, obj):
         pass
 
+    def remove_many(self, objs):
+        """
+        Removes several objects from the index. Override if the engine can
+        do this more efficiently than removing them one at a time.
+        """
+        for obj in objs:
+            self.remove(obj)
+
     def clear(self, models):
         pass
 
@@ -55,6 +55,7 @@ class QueryConverter(BaseQueryConverter):
     NOT             = "-"
     SEPARATOR       = ' '
     FIELDSEP        = ':'
+    PREFIX          = '*'
     
     def __init__(self):
         BaseQueryConverter.__init__(self)
@@ -47,3 +47,4 @@ class QueryConverter(BaseQueryConverter):
     SEPARATOR       = ' & '
     IN_QUOTES_SEP   = ' '
     FIELDSEP        = ':'
+    PREFIX          = ':*'
@@ -1,21 +1,27 @@
 import itertools
-import pysolr
+import re
 
 from django.conf import settings
 from django.db import models
 from django.utils.encoding import force_unicode
 from djangosearch.backends import BaseSearchEngine, search
 from djangosearch.query import BaseQueryConverter, convert
-from djangosearch.results import SearchResults
+from djangosearch.results import Hit, SearchResults
 
 MAX_INT = 2**31 - 1
 
+# Solr's default maxBooleanClauses.
+MAX_CLAUSES = 1024
+
 # TODO: Support for using Solr dynnamicField declarations, the magic fieldname
 # postfixes like _i for integers. Requires some sort of global field registry
 # though. Is it even worth it?
 
 class SearchEngine(BaseSearchEngine):
     def __init__(self):
+        # Imported here so that importing djangosearch doesn't pay for
+        # importing pysolr.
+        import pysolr
         args = [settings.SOLR_URL]
         self.conn = pysolr.Solr(*args)
 
@@ -45,6 +51,19 @@ class SearchEngine(BaseSearchEngine):
         solr_id = self.get_identifier(obj)
         self.conn.delete(id=solr_id, commit=commit)
 
+    def remove_many(self, objs, commit=True):
+        if not objs:
+            return
+        ids = ['"%s"' % _quoted_chars_re.sub(r"\\\1", self.get_identifier(obj))
+               for obj in objs]
+        # Delete them with as few requests as Solr's limit on the number of
+        # clauses in a query allows, and commit once at the end.
+        for start in range(0, len(ids), MAX_CLAUSES):
+            chunk = ids[start:start + MAX_CLAUSES]
+            last = start + MAX_CLAUSES >= len(ids)
+            self.conn.delete(q='id:(%s)' % ' OR '.join(chunk), 
+                             commit=commit and last)
+
     def clear(self, models, commit=True):
         # *:* matches all docs in Solr
         self.conn.delete(q='*:*', commit=commit)
@@ -54,12 +73,20 @@ class SearchEngine(BaseSearchEngine):
             return []
         solr_results = self._get_results_obj(query)
         results = []
+        content_types = {}
         for result in solr_results:
-            app_label, model_name = result['django_ct_s'].split('.')
-            results.append({
-                "model": models.get_model(app_label, model_name),
-                "pk": result['django_id_s'],
-                "relevance": None}) # FIXME: result['score'] doesn't work for some reason 
+            content_type = result['django_ct_s']
+            if content_type not in content_types:
+                app_label, model_name = content_type.split('.')
+                content_types[content_type] = models.get_model(app_label, 
+                                                               model_name)
+            fields = None
+            if query.fields is not None:
+                fields = dict([(name, result.get(name)) 
+                               for name in query.fields])
+            # FIXME: result['score'] doesn't work for some reason 
+            results.append(Hit(content_types[content_type], 
+                               result['django_id_s'], None, fields))
         return results
     
     def get_count(self, query):
@@ -95,6 +122,9 @@ class SearchEngine(BaseSearchEngine):
             kwargs['rows'] = MAX_INT
         if query.low_mark:
             kwargs['start'] = query.low_mark
+        # Only ask for the stored fields that are needed.
+        kwargs['fl'] = ','.join(['django_ct_s', 'django_id_s'] 
+                                + list(query.fields or []))
         return self.conn.search(final_q, **kwargs)
 
 
@@ -106,3 +136,15 @@ class QueryConverter(BaseQueryConverter):
     NOT             = "NOT "
     SEPARATOR       = ' AND '
     FIELDSEP        = ':'
+    PREFIX          = '*'
+
+    def escape_term(self, term):
+        # Terms are plain words in the common query format, so nothing in
+        # them may be read as Lucene syntax.
+        return _special_chars_re.sub(r"\\\1", term)
+
+# Characters with special meanings in Lucene's query syntax.
+_special_chars_re = re.compile(r'([-+!():^\[\]"{}~*?|&/\\])')
+
+# Characters that must be escaped in a quoted term.
+_quoted_chars_re = re.compile(r'(["\\])')
@@ -0,0 +1,154 @@
+"""
+Runs searches in the background, so that a request can wait on several
+searches at once rather than one after another.
+
+Work is done by a pool of ``SEARCH_BACKGROUND_THREADS`` threads (4 by
+default), started when they are first needed. Submitting work returns a
+Future, which can be waited on for the result.
+"""
+
+import sys
+import threading
+import Queue
+
+from django.conf import settings
+
+THREADS = getattr(settings, 'SEARCH_BACKGROUND_THREADS', 4)
+
+class Future(object):
+    """
+    The result of some work being done in the background.
+    """
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        """Returns True if the work has finished."""
+        return self._done.isSet()
+
+    def result(self, timeout=None):
+        """
+        Waits for the work to finish and returns its result, or raises the
+        exception it raised. Raises Timeout if ``timeout`` seconds pass
+        first.
+        """
+        self._done.wait(timeout)
+        if not self._done.isSet():
+            raise Timeout
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def add_done_callback(self, callback):
+        """
+        Calls ``callback`` with this future when the work has finished, or
+        straight away if it already has.
+        """
+        self._lock.acquire()
+        try:
+            if not self._done.isSet():
+                self._callbacks.append(callback)
+                return
+        finally:
+            self._lock.release()
+        callback(self)
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exc_info):
+        self._exc_info = exc_info
+        self._finish()
+
+    def _finish(self):
+        self._lock.acquire()
+        try:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        finally:
+            self._lock.release()
+        for callback in callbacks:
+            callback(self)
+
+class Timeout(Exception):
+    pass
+
+def completed(result):
+    """
+    Returns a Future that has already finished with the given result.
+    """
+    future = Future()
+    future.set_result(result)
+    return future
+
+class Pool(object):
+    """
+    A pool of threads doing work from a queue.
+
+    Each thread closes its database connection after each job, unless
+    ``keep_connections`` is True, in which case it keeps it open for the next
+    job and just rolls back anything left uncommitted.
+    """
+    def __init__(self, threads, keep_connections=False):
+        self.threads = threads
+        self.keep_connections = keep_connections
+        self._queue = Queue.Queue()
+        self._started = False
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Calls ``func`` with the given arguments in one of the threads, and
+        returns a Future for its result.
+        """
+        self._start()
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def _start(self):
+        if self._started:
+            return
+        self._lock.acquire()
+        try:
+            if not self._started:
+                for i in range(self.threads):
+                    thread = threading.Thread(target=self._work)
+                    thread.setDaemon(True)
+                    thread.start()
+                self._started = True
+        finally:
+            self._lock.release()
+
+    def _work(self):
+        from django.db import connection, transaction
+        while True:
+            future, func, args, kwargs = self._queue.get()
+            try:
+                try:
+                    result = func(*args, **kwargs)
+                except Exception:
+                    future.set_exception(sys.exc_info())
+                else:
+                    future.set_result(result)
+            finally:
+                if self.keep_connections:
+                    # Don't leave a transaction open between jobs.
+                    transaction.rollback_unless_managed()
+                else:
+                    # Don't hold on to a database connection between jobs.
+                    connection.close()
+
+pool = Pool(THREADS)
+
+def submit(func, *args, **kwargs):
+    """
+    Calls ``func`` with the given arguments in the background, and returns a
+    Future for its result.
+    """
+    return pool.submit(func, *args, **kwargs)
@@ -0,0 +1,218 @@
+"""
+Batches the index updates made when objects are saved and deleted, so that
+saving many objects makes one call to the search engine per model rather than
+one per object, and holds back the updates made in a transaction until it is
+committed.
+
+When ``SEARCH_BATCH_UPDATES`` is True, ModelIndex.update_object() and
+remove_object() add the object to a buffer for the current thread instead of
+updating the index straight away. Only the last change to each object is
+kept. The buffer is flushed, with one engine.update() and one
+engine.remove_many() call for each model:
+
+    * at the end of each request,
+    * when it holds ``SEARCH_BATCH_SIZE`` objects (1000 by default),
+    * when an object is added more than ``SEARCH_BATCH_INTERVAL`` seconds (10
+      by default) after the first object in the buffer,
+    * when the process exits, or
+    * when flush() is called.
+
+If the search engine fails, the changes that weren't made stay in the buffer
+to be tried again at the next flush. Errors from flushing at the end of a
+request, on exit or after a commit are logged to the ``djangosearch`` logger
+rather than raised.
+
+When ``SEARCH_INDEX_ON_COMMIT`` is True, changes made while Django is managing
+a transaction are held in a separate buffer for the thread. They are made
+together when the transaction is committed, and thrown away if it is rolled
+back, so the index never sees changes that didn't make it to the database.
+"""
+
+import atexit
+import logging
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import transaction
+
+BATCH_UPDATES = getattr(settings, 'SEARCH_BATCH_UPDATES', False)
+BATCH_SIZE = getattr(settings, 'SEARCH_BATCH_SIZE', 1000)
+BATCH_INTERVAL = getattr(settings, 'SEARCH_BATCH_INTERVAL', 10)
+INDEX_ON_COMMIT = getattr(settings, 'SEARCH_INDEX_ON_COMMIT', False)
+
+UPDATE, REMOVE = 'update', 'remove'
+
+logger = logging.getLogger('djangosearch')
+
+class UpdateBuffer(threading.local):
+    """
+    The index updates waiting to be made by a thread.
+    
+    If ``hold`` is True, the buffer is only flushed when flush() is called.
+    """
+    def __init__(self, hold=False):
+        self.hold = hold
+        self.discard()
+
+    def __len__(self):
+        return self.size
+
+    def add(self, index, action, obj):
+        """
+        Adds an UPDATE or REMOVE of ``obj`` in ``index`` to the buffer,
+        replacing any earlier change to the same object, and flushes the
+        buffer if it is full or old enough.
+        """
+        if action == REMOVE:
+            # Django clears the primary key of deleted objects after sending
+            # post_delete, so keep a copy with just the primary key.
+            obj = obj.__class__(pk=obj.pk)
+        objects = self.pending.setdefault(index, {})
+        if obj.pk not in objects:
+            self.size += 1
+        objects[obj.pk] = (action, obj)
+        if self.started is None:
+            self.started = time.time()
+        if self.hold:
+            return
+        if (self.size >= BATCH_SIZE or
+                time.time() - self.started >= BATCH_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        """
+        Makes the buffered updates to the index, a model at a time. Changes
+        that fail are put back in the buffer, and the first error is raised
+        once the rest have been tried.
+        """
+        pending = self.pending
+        self.discard()
+        errors = []
+        for index, objects in pending.items():
+            for action, make in ((UPDATE, index.update_objects),
+                                 (REMOVE, index.remove_objects)):
+                entries = dict([(pk, entry) for pk, entry in objects.items()
+                                if entry[0] == action])
+                try:
+                    make([entry[1] for entry in entries.values()])
+                except Exception:
+                    errors.append(sys.exc_info())
+                    self.restore(index, entries)
+        if errors:
+            raise errors[0][0], errors[0][1], errors[0][2]
+
+    def restore(self, index, entries):
+        """
+        Puts changes taken from the buffer back, given as a dictionary
+        mapping primary keys to (action, object), unless the objects have
+        changed again since.
+        """
+        if not entries:
+            return
+        objects = self.pending.setdefault(index, {})
+        for pk, entry in entries.items():
+            if pk not in objects:
+                objects[pk] = entry
+                self.size += 1
+        if self.started is None:
+            self.started = time.time()
+
+    def discard(self):
+        """
+        Throws away the buffered updates without making them.
+        """
+        # Maps each ModelIndex to a dictionary mapping primary keys to the
+        # (action, object) to apply.
+        self.pending = {}
+        self.size = 0
+        self.started = None
+
+buffer = UpdateBuffer()
+transaction_buffer = UpdateBuffer(hold=True)
+
+def is_deferred():
+    """
+    Returns True if changes to the index should be added to a buffer with
+    add() rather than made straight away.
+    """
+    return BATCH_UPDATES or (INDEX_ON_COMMIT and transaction.is_managed())
+
+def add(index, action, obj):
+    """
+    Adds an UPDATE or REMOVE of ``obj`` in ``index`` to the right buffer.
+    """
+    if INDEX_ON_COMMIT and transaction.is_managed():
+        _install_transaction_hooks()
+        transaction_buffer.add(index, action, obj)
+    else:
+        buffer.add(index, action, obj)
+
+def flush(**kwargs):
+    """
+    Makes the index updates buffered by the current thread, apart from those
+    waiting for a transaction to be committed.
+    """
+    buffer.flush()
+
+def _flush_quietly():
+    # Failing to update the index shouldn't break the request, exit or commit
+    # that flushed the buffer.
+    try:
+        buffer.flush()
+    except Exception:
+        logger.exception('Error updating the search index')
+
+def _request_finished(**kwargs):
+    _flush_quietly()
+    # Anything still waiting for a commit now was never committed.
+    transaction_buffer.discard()
+
+request_finished.connect(_request_finished)
+atexit.register(_flush_quietly)
+
+def _committed():
+    try:
+        transaction_buffer.flush()
+    except Exception:
+        logger.exception('Error updating the search index')
+        # The changes that failed have been committed, so try them again
+        # with the other buffered changes rather than throwing them away at
+        # the next rollback.
+        for index, objects in transaction_buffer.pending.items():
+            buffer.restore(index, objects)
+        transaction_buffer.discard()
+
+def _rolled_back():
+    transaction_buffer.discard()
+
+def _call_after(func, hook):
+    def wrapper(*args, **kwargs):
+        result = func(*args, **kwargs)
+        hook()
+        return result
+    wrapper.__name__, wrapper.__doc__ = func.__name__, func.__doc__
+    return wrapper
+
+_hooks_installed = False
+_hooks_lock = threading.Lock()
+
+def _install_transaction_hooks():
+    """
+    Django has no way to run code when a transaction is committed or rolled
+    back, so wrap the functions that do that.
+    """
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    _hooks_lock.acquire()
+    try:
+        if not _hooks_installed:
+            transaction.commit = _call_after(transaction.commit, _committed)
+            transaction.rollback = _call_after(transaction.rollback, 
+                                               _rolled_back)
+            _hooks_installed = True
+    finally:
+        _hooks_lock.release()
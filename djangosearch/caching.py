@@ -0,0 +1,120 @@
+"""
+A cache of search engine results and counts shared between requests, using
+Django's cache framework.
+
+Results are cached for ``SEARCH_RESULTS_CACHE_TIMEOUT`` seconds, or not at all
+if it is 0 (the default). Each model has a generation in the cache, which is
+part of the cache keys of results that could include it, and which is changed
+whenever one of its objects is updated in or removed from the index, so that
+those results are no longer used. Approximate counts are the exception, and
+are kept until they time out.
+"""
+
+import random
+import time
+
+from django.conf import settings
+from django.utils.hashcompat import md5_constructor
+
+TIMEOUT = getattr(settings, 'SEARCH_RESULTS_CACHE_TIMEOUT', 0)
+
+# django.core.cache sets up the cache backend when it is imported, so it is
+# only imported once caching is known to be on.
+
+class Prefetched(list):
+    """
+    Results that were cached before anyone asked for them.
+    """
+
+def get_results(query):
+    """
+    Returns the cached results for a SearchQuery, or None.
+    """
+    if not TIMEOUT:
+        return None
+    from django.core.cache import cache
+    return cache.get(_key('results', query))
+
+def set_results(query, results):
+    """
+    Caches the results for a SearchQuery.
+    """
+    if TIMEOUT:
+        from django.core.cache import cache
+        cache.set(_key('results', query), results, TIMEOUT)
+
+def get_count(query, approximate=False):
+    """
+    Returns the cached number of results for a SearchQuery, or None.
+    """
+    if not TIMEOUT:
+        return None
+    from django.core.cache import cache
+    return cache.get(_count_key(query, approximate))
+
+def set_count(query, count, approximate=False):
+    """
+    Caches the number of results for a SearchQuery.
+    """
+    if TIMEOUT:
+        from django.core.cache import cache
+        cache.set(_count_key(query, approximate), count, TIMEOUT)
+
+def invalidate(model):
+    """
+    Stops cached results that could include the given model from being used.
+    """
+    if TIMEOUT:
+        from django.core.cache import cache
+        cache.set(_generation_key(model), _new_generation())
+
+def _count_key(query, approximate):
+    if approximate:
+        return _key('approximate_count', query, generations=False)
+    return _key('count', query)
+
+def _key(kind, query, generations=True):
+    if query.models is not None:
+        models = query.models
+    else:
+        from djangosearch.indexer import get_indexed_models
+        models = get_indexed_models()
+    labels = sorted([_label(model) for model in models])
+    key = [_normalize(query.query), labels, list(query.order_by),
+           query.low_mark, query.high_mark, query.fields]
+    if generations:
+        key.append(_generations(models))
+    return 'djangosearch.%s.%s' % (kind, md5_constructor(repr(key)).hexdigest())
+
+def _normalize(query_string):
+    # Queries that parse to the same thing give the same results.
+    from djangosearch.query import ParseError, QueryTooComplex, _prepare
+    try:
+        return repr(_prepare(query_string))
+    except (ParseError, QueryTooComplex):
+        return query_string
+
+def _generations(models):
+    """
+    Returns the generations of the given models, sorted by model, starting
+    new ones for any models that don't have one in the cache.
+    """
+    from django.core.cache import cache
+    keys = sorted([_generation_key(model) for model in models])
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            generations[key] = _new_generation()
+            cache.set(key, generations[key])
+    return [generations[key] for key in keys]
+
+def _generation_key(model):
+    return 'djangosearch.generation.%s' % _label(model)
+
+def _new_generation():
+    # This must never repeat, or results cached before a generation was
+    # evicted from the cache could be used again.
+    return '%r.%r' % (time.time(), random.random())
+
+def _label(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.module_name)
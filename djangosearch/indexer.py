@@ -2,6 +2,7 @@ from django.core.exceptions import ImproperlyConfigured
 from django.db.models import signals
 from django.template import loader, Context, TemplateDoesNotExist
 from django.utils.encoding import smart_unicode, force_unicode
+from djangosearch import background, batching, caching, queueing
 
 class ModelIndex(object):
     """
@@ -32,14 +33,29 @@ class ModelIndex(object):
         self.text = text
         self.additional = additional
         self.model = model
-        
+        self._engine = None
+        self._templates = {}
+
+    # The backend and engine are loaded on first use rather than when the
+    # model is defined, so importing models doesn't import (and connect to)
+    # the search backend.
+
+    def _get_backend(self):
         # Avoid a circular import by putting this here
         from djangosearch.backends import backend
-        self.backend = backend
-        try:
-            self.engine = backend.SearchEngine()
-        except AttributeError:
-            self.engine = None
+        return backend
+    backend = property(_get_backend)
+
+    def _get_engine(self):
+        if self._engine is None:
+            from djangosearch.backends import get_engine
+            try:
+                self._engine = get_engine()
+            except AttributeError:
+                # SQL backends don't have an engine.
+                self._engine = False
+        return self._engine or None
+    engine = property(_get_engine)
 
     def contribute_to_class(self, model, name):
         self.model = model
@@ -67,19 +83,46 @@ class ModelIndex(object):
 
         If the template isn't found, defaults to a newline-joined list of each
         of the fields specified in the ``text`` attribute.
+
+        Whether the template was found is remembered for the life of the
+        process; call clear_template_cache() after adding or changing it.
+        """
+        t = self.get_template(obj)
+        if t is not None:
+            return t.render(Context({'object': obj}))
+        if self.text is None:
+            raise ImproperlyConfigured("Neither a template nor a text "
+                                       "initialization argument has been "
+                                       "provided for this index.")
+        return "\n".join([smart_unicode(f) 
+                          for f in self.get_text_values(obj).values()])
+
+    def get_template(self, obj):
+        """
+        Returns the compiled index template for an object, or None if there
+        isn't one.
         """
         opts = obj._meta
+        name = '%s/%s_index.txt' % (opts.app_label, opts.module_name)
+        # Looking for a template that doesn't exist tries every template
+        # loader, so remember when there isn't one too.
         try:
-            t = loader.get_template('%s/%s_index.txt' 
-                    % (opts.app_label, opts.module_name))
-            return t.render(Context({'object': obj}))
+            return self._templates[name]
+        except KeyError:
+            pass
+        try:
+            t = loader.get_template(name)
         except TemplateDoesNotExist:
-            if self.text is None:
-                raise ImproperlyConfigured("Neither a template nor a text "
-                                           "initialization argument has been "
-                                           "provided for this index.")
-            return "\n".join([smart_unicode(f) 
-                              for f in self.get_text_values(obj).values()])
+            t = None
+        self._templates[name] = t
+        return t
+
+    def clear_template_cache(self):
+        """
+        Forgets the templates found by get_template(), so that changes to
+        them are used, such as while developing them.
+        """
+        self._templates = {}
 
     def should_index(self, obj):
         """
@@ -147,27 +190,84 @@ class ModelIndex(object):
         """Update the entire index."""
         if self.engine:
             self.engine.update(self, self.get_query_set())
+            caching.invalidate(self.model)
 
     def update_object(self, instance, **kwargs):
         """
         Update the index for a single object. Attached to the class's
         post-save hook.
+
+        If the ``SEARCH_QUEUE_UPDATES`` setting is True, the update is queued
+        for the run_index_worker command instead (see djangosearch.queueing).
+        Otherwise, if the ``SEARCH_BATCH_UPDATES`` or
+        ``SEARCH_INDEX_ON_COMMIT`` settings are True, it may be buffered and
+        made later along with others (see djangosearch.batching).
         """
         if self.engine:
-            self.engine.update(self, [instance])
+            if queueing.QUEUE_UPDATES:
+                queueing.enqueue(batching.UPDATE, instance)
+            elif batching.is_deferred():
+                batching.add(self, batching.UPDATE, instance)
+            else:
+                self.update_objects([instance])
 
     def remove_object(self, instance, **kwargs):
         """
         Remove an object from the index. Attached to the class's delete 
         hook.
+
+        If the ``SEARCH_QUEUE_UPDATES`` setting is True, the removal is queued
+        for the run_index_worker command instead (see djangosearch.queueing).
+        Otherwise, if the ``SEARCH_BATCH_UPDATES`` or
+        ``SEARCH_INDEX_ON_COMMIT`` settings are True, it may be buffered and
+        made later along with others (see djangosearch.batching).
         """
         if self.engine:
-            self.engine.remove(instance)
+            if queueing.QUEUE_UPDATES:
+                queueing.enqueue(batching.REMOVE, instance)
+            elif batching.is_deferred():
+                batching.add(self, batching.REMOVE, instance)
+            else:
+                self.remove_objects([instance])
+
+    def update_objects(self, objects):
+        """Update the index for a list of objects at once."""
+        if self.engine and objects:
+            self.engine.update(self, objects)
+            caching.invalidate(self.model)
+
+    def remove_objects(self, objects):
+        """Remove a list of objects from the index at once."""
+        if self.engine and objects:
+            self.engine.remove_many(objects)
+            caching.invalidate(self.model)
+
+    def remove_objects_later(self, objects):
+        """
+        Remove a list of objects from the index without waiting for it to
+        happen. They are queued with ``SEARCH_QUEUE_UPDATES``, buffered with
+        ``SEARCH_BATCH_UPDATES``, or otherwise removed in the background.
+        
+        Unlike remove_object(), this doesn't wait for the current transaction
+        to be committed, so it is only for objects already gone from the
+        database.
+        """
+        if not self.engine or not objects:
+            return
+        if queueing.QUEUE_UPDATES:
+            for obj in objects:
+                queueing.enqueue(batching.REMOVE, obj)
+        elif batching.BATCH_UPDATES:
+            for obj in objects:
+                batching.buffer.add(self, batching.REMOVE, obj)
+        else:
+            background.submit(self.remove_objects, objects)
 
     def clear(self):
         """Clear the entire index."""
         if self.engine:
             self.engine.clear(models=[self.model])
+            caching.invalidate(self.model)
 
     def reindex(self):
         """Completely clear the index for this model and rebuild it."""
@@ -178,6 +278,14 @@ class ModelIndex(object):
         """Search the index."""
         return self.backend.search(query, models=[self.model])
 
+    def asearch(self, query):
+        """
+        Search the index, fetching the first results in the background (see
+        djangosearch.asearch()).
+        """
+        from djangosearch import _prefetch
+        return _prefetch(self.search(query))
+
 class ModelIndexDescriptor(object):
     # This class ensures indexes aren't accessible via model instances.
     # For example, Poll.index works, but poll_obj.index raises AttributeError.
@@ -207,6 +315,11 @@ def get_indexed_models():
     """Return a list of all models that have registered indexers."""
     return _model_indexers.keys()
 
+def clear_template_caches():
+    """Forget the index templates found by all registered model indexers."""
+    for indexer in _model_indexers.values():
+        indexer.clear_template_cache()
+
 def unregister_indexer(model):
     """Remove a registered model indexer"""
     del _model_indexers[model]
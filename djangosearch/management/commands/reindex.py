@@ -47,4 +47,4 @@ class Command(AppCommand):
                 end = min(start + self.batchsize, total)
                 if self.verbosity >= 2:
                     print "  indexing %s - %d of %d" % (start+1, end, total)
-                index.engine.update(index, qs[start:end])
+                index.update_objects(qs[start:end])
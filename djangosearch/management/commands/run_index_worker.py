@@ -0,0 +1,65 @@
+import sys
+import time
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from django.db import reset_queries
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('-b', '--batch-size', action='store', dest='batchsize',
+            default=100, type='int',
+            help='Number of objects to send to the search engine at once.'
+        ),
+        make_option('-c', '--concurrency', action='store', dest='concurrency',
+            default=1, type='int',
+            help='Number of batches to send to the search engine at once.'
+        ),
+        make_option('--retries', action='store', dest='retries',
+            default=5, type='int',
+            help='Number of times to try a change before giving up on it.'
+        ),
+        make_option('--retry-delay', action='store', dest='retry_delay',
+            default=60, type='int',
+            help='Seconds to wait before the first retry; doubled each time.'
+        ),
+        make_option('--interval', action='store', dest='interval',
+            default=5, type='float',
+            help='Seconds to wait when the queue is empty.'
+        ),
+        make_option('--once', action='store_true', dest='once', default=False,
+            help='Stop when the queue is empty instead of waiting for more.'
+        ),
+        make_option('--verbosity', action='store', dest='verbosity', default='1',
+            type='choice', choices=['0', '1', '2'],
+            help='Verbosity level; 0=minimal output, 1=normal output, 2=all output'
+        ),
+    )
+    help = "Make the index updates queued with SEARCH_QUEUE_UPDATES."
+
+    def handle_noargs(self, **options):
+        from djangosearch import background, queueing
+
+        verbosity = int(options.get('verbosity', 1))
+        concurrency = options.get('concurrency', 1)
+        pool = None
+        if concurrency > 1:
+            pool = background.Pool(concurrency)
+
+        while True:
+            stats = queueing.run_once(batch_size=options.get('batchsize', 100),
+                                      concurrency=concurrency,
+                                      retries=options.get('retries', 5),
+                                      retry_delay=options.get('retry_delay', 60),
+                                      pool=pool)
+            # Don't let the list of queries grow forever when DEBUG is on.
+            reset_queries()
+            if verbosity >= 1:
+                for error in stats.errors:
+                    sys.stderr.write("Error indexing: %s\n" % error)
+            if verbosity >= 2 and len(stats):
+                print "%d done, %d retrying, %d failed" % (
+                    stats.done, stats.retrying, stats.failed)
+            if not len(stats):
+                if options.get('once'):
+                    break
+                time.sleep(options.get('interval', 5))
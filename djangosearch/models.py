@@ -1 +1,20 @@
-# tests won't be run for this app unless there's a models.py file :(
\ No newline at end of file
+from django.db import models
+
+class QueuedUpdate(models.Model):
+    """
+    A change to an object waiting to be made in the index by the
+    run_index_worker command (see djangosearch.queueing).
+    """
+    ACTION_CHOICES = (
+        ('update', 'update'),
+        ('remove', 'remove'),
+    )
+
+    model = models.CharField(max_length=100)
+    object_id = models.CharField(max_length=255)
+    action = models.CharField(max_length=6, choices=ACTION_CHOICES)
+    attempts = models.PositiveIntegerField(default=0)
+    retry_after = models.DateTimeField(null=True, db_index=True)
+
+    def __unicode__(self):
+        return u'%s %s.%s' % (self.action, self.model, self.object_id)
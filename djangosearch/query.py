@@ -6,10 +6,22 @@ try:
     from cStringIO import StringIO
 except ImportError:
     from StringIO import StringIO
-import pyparsing
+import re
+import threading
+
+from django.conf import settings
 
 START, END, TERM = ("start", "end", "term")
 
+QUERY_CACHE_SIZE = getattr(settings, 'SEARCH_QUERY_CACHE_SIZE', 1000)
+OPTIMIZE_QUERIES = getattr(settings, 'SEARCH_OPTIMIZE_QUERIES', True)
+STOPWORDS = getattr(settings, 'SEARCH_STOPWORDS', ())
+MAX_QUERY_LENGTH = getattr(settings, 'SEARCH_MAX_QUERY_LENGTH', 1000)
+MAX_QUERY_TERMS = getattr(settings, 'SEARCH_MAX_QUERY_TERMS', 100)
+MAX_QUERY_DEPTH = getattr(settings, 'SEARCH_MAX_QUERY_DEPTH', 16)
+MAX_QUERY_OR_CLAUSES = getattr(settings, 'SEARCH_MAX_QUERY_OR_CLAUSES', 20)
+MAX_QUERY_COST = getattr(settings, 'SEARCH_MAX_QUERY_COST', 200)
+
 class SearchQuery(object):
     """
     A search query.
@@ -23,6 +35,7 @@ class SearchQuery(object):
     
         self.order_by = ["-relevance"]
         self.low_mark, self.high_mark = 0, None  # Used for offset/limit
+        self.fields = None  # Stored fields to return with each result
     
     def __str__(self):
         return self.query
@@ -35,6 +48,7 @@ class SearchQuery(object):
         c.order_by = self.order_by
         c.low_mark = self.low_mark
         c.high_mark = self.high_mark
+        c.fields = self.fields
         c.__dict__.update(kwargs)
         return c
     
@@ -64,7 +78,208 @@ class SearchQuery(object):
         """
         self.low_mark, self.high_mark = 0, None
 
-class BaseQueryConverter(object):
+class Node(object):
+    """
+    Base class for the nodes of a parsed query.
+
+    Nodes are immutable and hashable, so a parsed query can be cached and
+    shared between requests and backends. Subclasses list their attributes in
+    ``__slots__``; sequences of children are stored as tuples.
+    """
+    __slots__ = ()
+
+    def __init__(self, *args):
+        for name, value in zip(self.__slots__, args):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s nodes are immutable" % self.__class__.__name__)
+
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.__class__, self._key()))
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__,
+                           ", ".join([repr(v) for v in self._key()]))
+
+    def _key(self):
+        return tuple([getattr(self, name) for name in self.__slots__])
+
+class Term(Node):
+    """A single word."""
+    __slots__ = ('text',)
+
+class Prefix(Node):
+    """Matches words starting with ``text``."""
+    __slots__ = ('text',)
+
+class Phrase(Node):
+    """A quoted phrase; ``terms`` is a tuple of words."""
+    __slots__ = ('terms',)
+
+class Not(Node):
+    """Matches documents which don't match ``child``."""
+    __slots__ = ('child',)
+
+class Or(Node):
+    """Matches documents matching any of ``children``."""
+    __slots__ = ('children',)
+
+class And(Node):
+    """Matches documents matching all of ``children``."""
+    __slots__ = ('children',)
+
+class Group(Node):
+    """A bracketed sub-query."""
+    __slots__ = ('child',)
+
+class Field(Node):
+    """Matches documents where the field ``name`` matches ``value``."""
+    __slots__ = ('name', 'value')
+
+class NodeVisitor(object):
+    """
+    Walks a parsed query, calling a ``visit_<node class>`` method for each
+    node, e.g. ``visit_term()`` for a Term. The default for any node without
+    a method is to visit its children.
+    """
+    def visit(self, node):
+        method = getattr(self, 'visit_' + node.__class__.__name__.lower(),
+                         self.generic_visit)
+        return method(node)
+
+    def generic_visit(self, node):
+        for child in _children(node):
+            self.visit(child)
+
+def _children(node):
+    """Returns a tuple of the child nodes of ``node``."""
+    if isinstance(node, (Or, And)):
+        return node.children
+    elif isinstance(node, (Not, Group)):
+        return (node.child,)
+    elif isinstance(node, Field):
+        return (node.value,)
+    return ()
+
+class QueryOptimizer(NodeVisitor):
+    """
+    Simplifies a parsed query so backends have less work to do. It
+
+        * removes duplicate terms and clauses, so "a or a" becomes "a",
+        * flattens nested "and" and "or" clauses and removes brackets that
+          don't change the meaning of the query,
+        * removes double negations,
+        * moves field restrictions to the front, so backends can filter
+          before scoring, and
+        * drops ``stopwords``, except in phrases and field values.
+
+    The visit methods return the simplified node, or None if nothing is left
+    of it.
+    """
+    def __init__(self, stopwords=()):
+        self.stopwords = frozenset([word.lower() for word in stopwords])
+
+    def optimize(self, node):
+        """
+        Returns the simplified query, or ``node`` itself if the query consists
+        only of stopwords.
+        """
+        optimized = self.visit(node)
+        if optimized is None:
+            return node
+        if isinstance(optimized, Group):
+            return optimized.child
+        return optimized
+
+    def visit_term(self, node):
+        if node.text.lower() in self.stopwords:
+            return None
+        return node
+
+    def visit_prefix(self, node):
+        return node
+
+    def visit_phrase(self, node):
+        return node
+
+    def visit_not(self, node):
+        child = self.visit(node.child)
+        if child is None:
+            return None
+        if isinstance(child, Not):
+            return child.child
+        return Not(_grouped(child))
+
+    def visit_group(self, node):
+        child = self.visit(node.child)
+        if child is None:
+            return None
+        return _grouped(child)
+
+    def visit_field(self, node):
+        value = self.visit(node.value) or node.value
+        return Field(node.name, _grouped(value))
+
+    def visit_and(self, node):
+        children = self._visit_children(node.children, And)
+        # Stable, so the other clauses keep their order.
+        fields = [child for child in children if isinstance(child, Field)]
+        others = [child for child in children if not isinstance(child, Field)]
+        return self._join(And, fields + others)
+
+    def visit_or(self, node):
+        return self._join(Or, self._visit_children(node.children, Or))
+
+    def _visit_children(self, children, cls):
+        visited = []
+        for child in children:
+            child = self.visit(child)
+            if isinstance(child, Group) and isinstance(child.child, cls):
+                child = child.child
+            if isinstance(child, cls):
+                visited.extend(child.children)
+            elif child is not None:
+                visited.append(child)
+        return visited
+
+    def _join(self, cls, children):
+        unique = []
+        seen = set()
+        for child in children:
+            if child not in seen:
+                seen.add(child)
+                unique.append(child)
+        if not unique:
+            return None
+        elif len(unique) == 1:
+            return unique[0]
+        return cls(tuple(unique))
+
+def _grouped(node):
+    """
+    Returns ``node`` in brackets if it needs them to be used as an operand.
+    """
+    if isinstance(node, (And, Or)):
+        return Group(node)
+    return node
+
+_optimizer = QueryOptimizer(STOPWORDS)
+
+def optimize(tree):
+    """
+    Simplify a parsed query, dropping the stopwords listed in the
+    ``SEARCH_STOPWORDS`` setting. See QueryOptimizer.
+    """
+    return _optimizer.optimize(tree)
+
+class BaseQueryConverter(NodeVisitor):
     """
     Abstract search query converter base class. This will actually work, if by
     "work" you mean "echo the orginal query string"...
@@ -72,6 +287,12 @@ class BaseQueryConverter(object):
     For most real-world syntaxes, overriding the constants below should work
     to make a custom search grammar, but you can override methods and do
     anything, really.
+
+    Converters are run on the shape of a query, with its terms replaced by
+    placeholders, and the result is cached as a QueryTemplate that later
+    queries of the same shape are filled into. So the output must only depend
+    on the text of the terms through ``escape_term()``; converters for which
+    that isn't true should set ``USE_TEMPLATES`` to False.
     """
 
     QUOTES          = '""'
@@ -81,6 +302,8 @@ class BaseQueryConverter(object):
     SEPARATOR       = ' '
     IN_QUOTES_SEP   = ' '
     FIELDSEP        = ':'
+    PREFIX          = '*'
+    USE_TEMPLATES   = True
 
     def __init__(self):
         self.converted = StringIO()
@@ -97,6 +320,13 @@ class BaseQueryConverter(object):
         self.converted.write(term)
         self.write_sep()
 
+    def escape_term(self, term):
+        """
+        Returns a term escaped for the backend's query syntax. This must leave
+        NUL characters and digits alone, as they mark the slots in templates.
+        """
+        return term
+
     def write_sep(self):
         if self.sepstack:
             sep = self.sepstack.pop()
@@ -134,59 +364,424 @@ class BaseQueryConverter(object):
     def start_or(self):
         self.sepstack.append(self.OR)
 
+    def handle_event(self, action, arg):
+        """
+        Calls the method for an event, e.g. ``start_quotes()`` for
+        ``(START, 'quotes')``, if the converter has one.
+        """
+        if action == TERM:
+            self.handle_term(arg)
+        else:
+            callback = getattr(self, "%s_%s" % (action, arg), None)
+            if callback:
+                callback()
+
+    # The visit methods fire the same events, in the same order, as parse()
+    # yields for the query, so converters only need to handle events.
+
+    def visit_term(self, node):
+        self.handle_term(self.escape_term(node.text))
+
+    def visit_prefix(self, node):
+        self.handle_event(START, 'prefix')
+        self.handle_term(self.escape_term(node.text) + self.PREFIX)
+        self.handle_event(END, 'prefix')
+
+    def visit_phrase(self, node):
+        self.handle_event(START, 'quotes')
+        for term in node.terms:
+            self.handle_term(self.escape_term(term))
+        self.handle_event(END, 'quotes')
+
+    def visit_not(self, node):
+        self.handle_event(START, 'not')
+        self.visit(node.child)
+        self.handle_event(END, 'not')
+
+    def visit_or(self, node):
+        for child in node.children[:-1]:
+            self.handle_event(START, 'or')
+            self._visit_operand(child)
+        self.visit(node.children[-1])
+        for child in node.children[:-1]:
+            self.handle_event(END, 'or')
+
+    def visit_group(self, node):
+        self.handle_event(START, 'group')
+        self.visit(node.child)
+        self.handle_event(END, 'group')
+
+    def visit_field(self, node):
+        self.handle_event(START, 'field')
+        self.handle_event(START, 'fieldname')
+        self.handle_term(node.name)
+        self.handle_event(END, 'fieldname')
+        self.visit(node.value)
+        self.handle_event(END, 'field')
+
+    def _visit_operand(self, node):
+        # Only the last operand of an "or" may be several terms.
+        if isinstance(node, And):
+            node = Group(node)
+        self.visit(node)
+
+class QueryCache(object):
+    """
+    A thread-safe cache of converted queries which holds at most ``max_size``
+    entries, discarding the least recently used ones first. A ``max_size``
+    of 0 disables caching.
+
+    The ``hits``, ``misses`` and ``evictions`` counters can be used to size
+    the cache for a site's query distribution.
+    """
+    # Indexes into the entries of the linked list kept in recency order.
+    PREV, NEXT, KEY, VALUE = 0, 1, 2, 3
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        """
+        Empties the cache and resets the counters.
+        """
+        self.lock.acquire()
+        try:
+            self.entries = {}
+            self.root = root = []
+            root[:] = [root, root, None, None]
+            self.hits = self.misses = self.evictions = 0
+        finally:
+            self.lock.release()
+
+    def get(self, key):
+        """
+        Returns the value cached for ``key``, or None if there isn't one.
+        """
+        self.lock.acquire()
+        try:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._unlink(entry)
+            self._link_last(entry)
+            return entry[self.VALUE]
+        finally:
+            self.lock.release()
+
+    def set(self, key, value):
+        """
+        Caches ``value`` for ``key``, evicting the least recently used entry
+        if the cache is full.
+        """
+        if self.max_size <= 0:
+            return
+        self.lock.acquire()
+        try:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry[self.VALUE] = value
+                self._unlink(entry)
+            else:
+                if len(self.entries) >= self.max_size:
+                    oldest = self.root[self.NEXT]
+                    self._unlink(oldest)
+                    del self.entries[oldest[self.KEY]]
+                    self.evictions += 1
+                entry = [None, None, key, value]
+                self.entries[key] = entry
+            self._link_last(entry)
+        finally:
+            self.lock.release()
+
+    def _unlink(self, entry):
+        prev, next = entry[self.PREV], entry[self.NEXT]
+        prev[self.NEXT], next[self.PREV] = next, prev
+
+    def _link_last(self, entry):
+        # The most recently used entry is linked in just before the root.
+        last = self.root[self.PREV]
+        entry[self.PREV], entry[self.NEXT] = last, self.root
+        last[self.NEXT] = self.root[self.PREV] = entry
+
+    def stats(self):
+        """
+        Returns a dictionary of the cache's size and counters.
+        """
+        return {'size': len(self), 'max_size': self.max_size,
+                'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+query_cache = QueryCache(QUERY_CACHE_SIZE)
+
 def convert(query_string, converter_class):
     """
     Convert a query string in common format into a backend-specific format,
     given a a converter class to handle callbacks (see QueryConverter in
     search.base).
+
+    Results are cached in ``query_cache``.
     """
-    # Don't pass empty strings into pyparsing. It's fussy about that.
-    if len(query_string) == 0:
-        return query_string
-    c = converter_class()
-    for action, arg in parse(query_string):
-        if action == TERM:
-            c.handle_term(arg)
-        else:
-            callback = getattr(c, "%s_%s" % (action, arg), None)
-            if callback:
-                callback()
-    return str(c)
+    key = ('convert', query_string, converter_class)
+    converted = query_cache.get(key)
+    if converted is None:
+        converted = _convert(query_string, converter_class)
+        query_cache.set(key, converted)
+    return converted
 
 def convert_new(query_string, converter_class):
     """
     Convert a query string in common format into a backend-specific format,
     given a a converter class to handle callbacks (see QueryConverter in
-    search.base).
+    search.base). Returns the converted query string and a dictionary of the
+    "field:value" restrictions, which are not included in the query string.
+
+    Results are cached in ``query_cache``.
+    """
+    key = ('convert_new', query_string, converter_class)
+    result = query_cache.get(key)
+    if result is None:
+        result = _convert_new(query_string, converter_class)
+        query_cache.set(key, result)
+    # Callers are free to modify the fields they get back.
+    return (result[0], result[1].copy())
+
+def _convert(query_string, converter_class):
+    """
+    The uncached implementation of convert().
+    """
+    # Empty strings have nothing to parse, so don't raise a ParseError.
+    if len(query_string) == 0:
+        return query_string
+    return _convert_tree(_prepare(query_string), converter_class)
+
+def _convert_new(query_string, converter_class):
+    """
+    The uncached implementation of convert_new().
     """
     fields = {}
-    c = converter_class()
-    # track the state of a few things while we're parsing the event steam
-    parsing_fieldname = False # are we parsing a fieldname?
-    parsing_fieldval = False # are we parsing a field value?
-    current_fieldname = None # what is the name of the field we are parsing?
-    # parse the event stream
-    for action, arg in parse(query_string):
-        if action == TERM:
-            if parsing_fieldname:
-                current_fieldname = arg
-            elif parsing_fieldval:
-                fields[current_fieldname] = arg
-            else:
-                c.handle_term(arg)
-        elif action == START and arg == 'fieldname':
-            parsing_fieldname = True
-        elif action == END and arg == 'fieldname':
-            parsing_fieldname = False
-        elif action == START and arg == 'field':
-            parsing_fieldval = True
-        elif action == END and arg == 'field':
-            parsing_fieldval = False
+    tree = _extract_fields(_prepare(query_string), fields)
+    if tree is None:
+        return (str(converter_class()), fields)
+    return (_convert_tree(tree, converter_class), fields)
+
+def _convert_tree(tree, converter_class):
+    if not converter_class.USE_TEMPLATES:
+        c = converter_class()
+        c.visit(tree)
+        return str(c)
+    terms = []
+    key = ('template', _signature(tree, terms), converter_class)
+    template = query_cache.get(key)
+    if template is None:
+        template = QueryTemplate(_shape(tree, []), converter_class)
+        query_cache.set(key, template)
+    return template.render(terms)
+
+class QueryTemplate(object):
+    """
+    A query converted for a backend, with slots where its terms go.
+
+    Templates are made from the shape of a parsed query (see _shape), and can
+    be filled in with the terms of any query of that shape, skipping the
+    conversion.
+    """
+    def __init__(self, shape, converter_class):
+        c = converter_class()
+        c.visit(shape)
+        # Splitting on the slots leaves the literal text at even indexes and
+        # the slot numbers at odd ones.
+        self.parts = _slot_re.split(str(c))
+        for i in range(1, len(self.parts), 2):
+            self.parts[i] = int(self.parts[i])
+        self.escape = c.escape_term
+
+    def render(self, terms):
+        """
+        Returns the converted query for the given list of terms.
+        """
+        parts = self.parts[:]
+        for i in range(1, len(parts), 2):
+            parts[i] = self.escape(terms[parts[i]])
+        return "".join(parts)
+
+# Terms can't contain NUL characters, so they mark the slots in templates.
+_SLOT = "\x00%d\x00"
+_slot_re = re.compile("\x00(\\d+)\x00")
+
+def _signature(tree, terms):
+    """
+    Returns a tuple describing the shape of a parsed query, appending its
+    terms to ``terms`` in the same order as _shape. This is much cheaper than
+    building the shape itself.
+    """
+    signature = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        cls = node.__class__
+        if cls is Term:
+            terms.append(node.text)
+            signature.append(None)
+        elif cls is Prefix:
+            terms.append(node.text)
+            signature.append(Prefix)
+        elif cls is Phrase:
+            terms.extend(node.terms)
+            signature.append(len(node.terms))
+        elif cls is And or cls is Or:
+            signature.append((cls, len(node.children)))
+            stack.extend(node.children[::-1])
+        elif cls is Field:
+            signature.append(node.name)
+            stack.append(node.value)
         else:
-            callback = getattr(c, "%s_%s" % (action, arg), None)
-            if callback:
-                callback()
-    return (str(c), fields)
+            signature.append(cls)
+            stack.append(node.child)
+    return tuple(signature)
+
+def _shape(node, terms):
+    """
+    Returns a copy of a parsed query with each term replaced by a numbered
+    slot, appending the terms to ``terms``.
+    """
+    if isinstance(node, (Term, Prefix)):
+        terms.append(node.text)
+        return node.__class__(_SLOT % (len(terms) - 1))
+    elif isinstance(node, Phrase):
+        slots = []
+        for term in node.terms:
+            terms.append(term)
+            slots.append(_SLOT % (len(terms) - 1))
+        return Phrase(tuple(slots))
+    elif isinstance(node, (Or, And)):
+        return node.__class__(tuple([_shape(child, terms)
+                                     for child in node.children]))
+    elif isinstance(node, Field):
+        return Field(node.name, _shape(node.value, terms))
+    return node.__class__(_shape(node.child, terms))
+
+def _prepare(query_string):
+    """
+    Returns the parsed query ready for conversion, optimized if the
+    ``SEARCH_OPTIMIZE_QUERIES`` setting is on.
+    """
+    tree = parse_tree(query_string)
+    if OPTIMIZE_QUERIES:
+        tree = optimize(tree)
+    return tree
+
+def _extract_fields(node, fields):
+    """
+    Removes the "field:value" restrictions from a parsed query, adding them to
+    ``fields``. Returns what is left of the query, or None if nothing is.
+
+    Only single words and phrases can be used as field values; restrictions
+    with other values are dropped, and prefixes match whole words.
+    """
+    if isinstance(node, Field):
+        if isinstance(node.value, (Term, Prefix)):
+            fields[node.name] = node.value.text
+        elif isinstance(node.value, Phrase):
+            fields[node.name] = " ".join(node.value.terms)
+        return None
+    elif isinstance(node, (Or, And)):
+        children = [_extract_fields(child, fields) for child in node.children]
+        children = tuple([child for child in children if child is not None])
+        if len(children) > 1:
+            return node.__class__(children)
+        return children and children[0] or None
+    elif isinstance(node, (Not, Group)):
+        child = _extract_fields(node.child, fields)
+        if child is not None:
+            return node.__class__(child)
+        return None
+    return node
+
+class QueryTooComplex(Exception):
+    """
+    Raised when a query is over one of the limits set by the
+    ``SEARCH_MAX_QUERY_*`` settings.
+    """
+    pass
+
+_or_re = re.compile(r"(?<![A-Za-z0-9_$])or(?![A-Za-z0-9_$])")
+
+def check_query(query_string):
+    """
+    Check a query string against the ``SEARCH_MAX_QUERY_*`` limits on its
+    length, number of terms, bracket nesting depth and number of "or" clauses
+    before parsing it, raising QueryTooComplex if it is over any of them.
+
+    The checks are cheap rather than exact; words and "or" inside phrases are
+    counted too.
+    """
+    if MAX_QUERY_LENGTH and len(query_string) > MAX_QUERY_LENGTH:
+        raise QueryTooComplex("Queries can't be longer than %d characters."
+                              % MAX_QUERY_LENGTH)
+    if MAX_QUERY_TERMS and len(query_string.split()) > MAX_QUERY_TERMS:
+        raise QueryTooComplex("Queries can't have more than %d terms."
+                              % MAX_QUERY_TERMS)
+    if (MAX_QUERY_OR_CLAUSES
+            and len(_or_re.findall(query_string)) > MAX_QUERY_OR_CLAUSES):
+        raise QueryTooComplex("Queries can't have more than %d \"or\" clauses."
+                              % MAX_QUERY_OR_CLAUSES)
+    if MAX_QUERY_DEPTH and query_string.count("(") > MAX_QUERY_DEPTH:
+        depth = 0
+        for char in query_string:
+            if char == "(":
+                depth += 1
+                if depth > MAX_QUERY_DEPTH:
+                    raise QueryTooComplex("Brackets can't be nested more than "
+                                          "%d deep." % MAX_QUERY_DEPTH)
+            elif char == ")" and depth:
+                depth -= 1
+
+def query_cost(node):
+    """
+    Estimate the cost of running a parsed query: one for each word and each
+    operator, with words in phrases counting double since the engine has to
+    check their positions, and prefixes counting four since they match
+    several words.
+    """
+    if isinstance(node, Term):
+        return 1
+    elif isinstance(node, Prefix):
+        return 4
+    elif isinstance(node, Phrase):
+        return 2 * len(node.terms)
+    cost = 1
+    for child in _children(node):
+        cost += query_cost(child)
+    return cost
+
+def parse_tree(query_string):
+    """
+    Parse a common query string into a tree of Node objects, e.g. the search
+    string "django rocks author:jacob" gives::
+
+        And((Term('django'), Term('rocks'), Field('author', Term('jacob'))))
+
+    Raises QueryTooComplex if the query is over the ``SEARCH_MAX_QUERY_*``
+    limits (see check_query), or if its estimated cost (see query_cost) is
+    over ``SEARCH_MAX_QUERY_COST``. Parsed queries are cached in
+    ``query_cache``.
+    """
+    key = ('parse', query_string)
+    tree = query_cache.get(key)
+    if tree is None:
+        check_query(query_string)
+        tree = _parser(query_string)
+        if MAX_QUERY_COST and query_cost(tree) > MAX_QUERY_COST:
+            raise QueryTooComplex("The query is too complex.")
+        query_cache.set(key, tree)
+    return tree
 
 def parse(query_string):
     """
@@ -208,22 +803,245 @@ def parse(query_string):
          (TERM,  'jacob'),
          (END,   'field')]
     """
-    return _event_generator(_parser(query_string))
+    return _event_generator(parse_tree(query_string))
 
-def _event_generator(stream):
-    for n in stream:
-        if isinstance(n, pyparsing.ParseResults):
-            yield ("start", n.getName())
-            for event in _event_generator(n):
-                yield event
-            yield ("end", n.getName())
+def _event_generator(tree):
+    # Walks the tree with an explicit stack rather than recursively, so each
+    # event is only yielded once however deeply it is nested. The stack holds
+    # nodes still to be walked and the events to yield once they have been.
+    stack = [tree]
+    pop, push = stack.pop, stack.append
+    while stack:
+        node = pop()
+        if not isinstance(node, Node):
+            yield node
+        elif isinstance(node, Term):
+            yield (TERM, node.text)
+        elif isinstance(node, Prefix):
+            yield (START, 'prefix')
+            yield (TERM, node.text)
+            yield (END, 'prefix')
+        elif isinstance(node, And):
+            stack.extend(node.children[::-1])
+        elif isinstance(node, Or):
+            # Each "or" in the query string joins two operands; the last
+            # operand of the last one may be several terms.
+            operands = node.children[:-1]
+            stack.extend([(END, 'or')] * len(operands))
+            push(node.children[-1])
+            for child in operands[::-1]:
+                if isinstance(child, And):
+                    child = Group(child)
+                push(child)
+                push((START, 'or'))
+        elif isinstance(node, Phrase):
+            yield (START, 'quotes')
+            for term in node.terms:
+                yield (TERM, term)
+            yield (END, 'quotes')
+        elif isinstance(node, Field):
+            yield (START, 'field')
+            yield (START, 'fieldname')
+            yield (TERM, node.name)
+            yield (END, 'fieldname')
+            push((END, 'field'))
+            push(node.value)
         else:
-            yield ("term", n)
+            name = isinstance(node, Not) and 'not' or 'group'
+            yield (START, name)
+            push((END, name))
+            push(node.child)
+
+class ParseError(Exception):
+    """
+    Raised when nothing at the start of a query string can be parsed.
+    """
+    def __init__(self, query_string, pos):
+        Exception.__init__(self, "Could not parse %r (at char %d)"
+                                 % (query_string, pos))
+        self.query_string = query_string
+        self.pos = pos
+
+# The character classes below are exactly those of the original pyparsing
+# grammar (see _make_pyparsing_parser), so terms are split the same way.
+_whitespace_re = re.compile(r"[ \t\n\r]*")
+_term_re = re.compile(u"[\xc0-\xd6\xd8-\xf6\xf8-\xfeA-Za-z0-9.!?,;$&%/-]+")
+_fieldname_re = re.compile(r"[A-Za-z0-9_]+")
+_KEYWORD_CHARS = frozenset("abcdefghijklmnopqrstuvwxyz"
+                           "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_$")
+
+class _Parser(object):
+    """
+    A hand-written recursive descent parser for the common query format.
+
+    Each ``_parse_*`` method takes a position in the query string and returns
+    a ``(node, position)`` pair, or None if nothing matched there. The grammar
+    is the same as that of the old pyparsing parser::
+
+        query  := or_+
+        or_    := field "or" query | field
+        field  := fieldname ":" not_ | not_
+        not_   := "-" parens | parens
+        parens := "(" query ")" | quotes
+        quotes := '"' word+ '"' | "'" word+ "'" | term
+        term   := word "*" | word
+
+    Alternatives are only ever retried from a failed field or not, and in
+    both cases the fallback is a single term, so nothing is parsed twice.
+    The one exception is a failed ``or_`` being retried by an enclosing
+    query, so those failures are remembered by position.
+
+    The only addition to the old grammar is the ``*`` suffix for prefixes.
+    """
+    def __init__(self, query_string):
+        self.query_string = query_string
+        self.length = len(query_string)
+        self.failed = set()
+
+    def parse(self):
+        nodes, pos = self._parse_query(0)
+        if not nodes:
+            raise ParseError(self.query_string, self._skip(0))
+        return _and(nodes)
+
+    def _skip(self, pos):
+        return _whitespace_re.match(self.query_string, pos).end()
+
+    def _parse_literal(self, pos, char):
+        pos = self._skip(pos)
+        if pos < self.length and self.query_string[pos] == char:
+            return pos + 1
+        return None
+
+    def _parse_query(self, pos):
+        nodes = []
+        while True:
+            result = self._parse_or(pos)
+            if result is None:
+                return nodes, pos
+            node, pos = result
+            nodes.append(node)
+
+    def _parse_or(self, pos):
+        if pos in self.failed:
+            return None
+        result = self._parse_field(pos)
+        if result is None:
+            self.failed.add(pos)
+            return None
+        node, end = result
+        keyword_end = self._parse_keyword(end)
+        if keyword_end is not None:
+            nodes, query_end = self._parse_query(keyword_end)
+            if nodes:
+                return Or((node, _and(nodes))), query_end
+        return node, end
+
+    def _parse_keyword(self, pos):
+        s = self.query_string
+        pos = self._skip(pos)
+        if (s.startswith("or", pos)
+                and (pos + 2 >= self.length or s[pos + 2] not in _KEYWORD_CHARS)
+                and (pos == 0 or s[pos - 1] not in _KEYWORD_CHARS)):
+            return pos + 2
+        return None
+
+    def _parse_field(self, pos):
+        start = self._skip(pos)
+        match = _fieldname_re.match(self.query_string, start)
+        if match is not None:
+            colon_end = self._parse_literal(match.end(), ":")
+            if colon_end is not None:
+                result = self._parse_not(colon_end)
+                if result is not None:
+                    node, end = result
+                    return Field(match.group(), node), end
+            # Anything that starts like a fieldname can only be a term.
+            return self._parse_term(start)
+        return self._parse_not(start)
+
+    def _parse_not(self, pos):
+        start = self._skip(pos)
+        if start < self.length and self.query_string[start] == "-":
+            result = self._parse_parens(start + 1)
+            if result is not None:
+                node, end = result
+                return Not(node), end
+            # "-" is also a term character, so fall back to a term.
+            return self._parse_term(start)
+        return self._parse_parens(start)
+
+    def _parse_parens(self, pos):
+        start = self._skip(pos)
+        if start < self.length and self.query_string[start] == "(":
+            nodes, end = self._parse_query(start + 1)
+            if nodes:
+                end = self._parse_literal(end, ")")
+                if end is not None:
+                    return Group(_and(nodes)), end
+            return None
+        return self._parse_quotes(start)
+
+    def _parse_quotes(self, pos):
+        start = self._skip(pos)
+        if start < self.length and self.query_string[start] in "\"'":
+            quote = self.query_string[start]
+            terms = []
+            end = start + 1
+            while True:
+                result = self._parse_word(end)
+                if result is None:
+                    break
+                term, end = result
+                terms.append(term)
+            if terms:
+                end = self._parse_literal(end, quote)
+                if end is not None:
+                    return Phrase(tuple(terms)), end
+            return None
+        return self._parse_term(start)
+
+    def _parse_term(self, pos):
+        result = self._parse_word(pos)
+        if result is None:
+            return None
+        word, end = result
+        if self.query_string.startswith("*", end):
+            return Prefix(word), end + 1
+        return Term(word), end
+
+    def _parse_word(self, pos):
+        match = _term_re.match(self.query_string, self._skip(pos))
+        if match is None:
+            return None
+        return match.group(), match.end()
+
+def _and(nodes):
+    if len(nodes) == 1:
+        return nodes[0]
+    return And(tuple(nodes))
 
 def _make_parser():
     """Create the search string parser."""
+    return lambda query_string: _Parser(query_string).parse()
+
+def _make_pyparsing_parser(packrat=False):
+    """
+    Create the original pyparsing search string parser, which returns a list
+    of events. This is no longer used for searching, but is kept as the
+    reference the hand-written parser is tested and benchmarked against.
+
+    If ``packrat`` is True, pyparsing's packrat memoization is turned on. Note
+    that this affects every pyparsing grammar in the process, and can't be
+    turned off again. The memo table is cleared at the start of each parse,
+    so it only ever holds the entries for a single query string.
+    """
+    import pyparsing
     from pyparsing import Word, Group, alphanums, alphas8bit, Forward, Suppress, Keyword, OneOrMore
 
+    if packrat:
+        pyparsing.ParserElement.enablePackrat()
+
     query = Forward()
 
     term = Word(alphas8bit+alphanums+"-.!?,;$&%/").setResultsName("term")
@@ -251,7 +1069,18 @@ def _make_parser():
     ).setResultsName("or") | field
 
     query << OneOrMore(or_).setResultsName("query")
-    
-    return query.parseString
+
+    def to_events(results):
+        events = []
+        for n in results:
+            if isinstance(n, pyparsing.ParseResults):
+                events.append((START, n.getName()))
+                events.extend(to_events(n))
+                events.append((END, n.getName()))
+            else:
+                events.append((TERM, n))
+        return events
+
+    return lambda query_string: to_events(query.parseString(query_string))
     
 _parser = _make_parser()
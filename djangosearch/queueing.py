@@ -0,0 +1,170 @@
+"""
+A queue of index updates kept in the database, so that saving and deleting
+objects doesn't wait on the search engine at all.
+
+When ``SEARCH_QUEUE_UPDATES`` is True, ModelIndex.update_object() and
+remove_object() add a QueuedUpdate to the queue instead of changing the index.
+It is saved in the same transaction as the object, so changes that are rolled
+back are never queued. The run_index_worker management command makes the
+queued changes, calling run_once() over and over.
+
+A queued change only says which object changed. When it is made, the object
+is loaded from the database again, and updated in the index if it is still
+there (and should be indexed), or removed from the index if not. So any
+number of queued changes to an object are made as one, and making a change
+late or twice, as happens when it is retried, still leaves the index right.
+"""
+
+import datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q, get_model
+from django.utils.encoding import smart_unicode
+
+QUEUE_UPDATES = getattr(settings, 'SEARCH_QUEUE_UPDATES', False)
+
+def enqueue(action, obj):
+    """
+    Queues an UPDATE or REMOVE of ``obj``.
+    """
+    # Imported here so that "import djangosearch" doesn't import
+    # djangosearch.models too. Django still loads it, as it does every
+    # installed app's models.
+    from djangosearch.models import QueuedUpdate
+    opts = obj._meta
+    QueuedUpdate.objects.create(
+        model='%s.%s' % (opts.app_label, opts.module_name),
+        object_id=smart_unicode(obj.pk), action=action)
+
+class Stats(object):
+    """
+    The number of queued changes a call to run_once() made, will retry and
+    gave up on.
+    """
+    def __init__(self):
+        self.done = self.retrying = self.failed = 0
+        self.errors = []
+
+    def __len__(self):
+        return self.done + self.retrying + self.failed
+
+    def __repr__(self):
+        return '<Stats: %d done, %d retrying, %d failed>' % (
+            self.done, self.retrying, self.failed)
+
+def run_once(batch_size=100, concurrency=1, retries=5, retry_delay=60,
+             pool=None):
+    """
+    Makes up to ``batch_size * concurrency`` queued changes, oldest first, and
+    returns a Stats.
+
+    The changes are made in batches of up to ``batch_size`` objects of the
+    same model, with up to ``concurrency`` batches sent to the search engine
+    at once using ``pool``, a djangosearch.background.Pool. No more changes
+    are taken from the queue until every batch has finished, which keeps the
+    load on the search engine in check however long the queue gets.
+
+    If a batch fails, its changes are tried again after ``retry_delay``
+    seconds, doubling each time, and are given up on after ``retries``
+    attempts.
+    """
+    from djangosearch.models import QueuedUpdate
+    stats = Stats()
+    items = list(QueuedUpdate.objects.filter(
+        Q(retry_after__isnull=True) | Q(retry_after__lte=datetime.datetime.now())
+    ).order_by('id')[:batch_size * concurrency])
+    if not items:
+        return stats
+
+    batches, unknown = _make_batches(items, batch_size)
+    done = list(unknown)
+    if pool is None or concurrency == 1:
+        for batch in batches:
+            try:
+                batch.run()
+            except Exception, e:
+                batch.error = e
+    else:
+        futures = [(batch, pool.submit(batch.run)) for batch in batches]
+        for batch, future in futures:
+            try:
+                future.result()
+            except Exception, e:
+                batch.error = e
+
+    failed = []
+    for batch in batches:
+        if batch.error is None:
+            done.extend(batch.items)
+        else:
+            failed.extend(batch.items)
+            stats.errors.append(batch.error)
+
+    QueuedUpdate.objects.filter(pk__in=[item.pk for item in done]).delete()
+    stats.done = len(done)
+    for item in failed:
+        item.attempts += 1
+        if item.attempts >= retries:
+            item.delete()
+            stats.failed += 1
+        else:
+            delay = retry_delay * 2 ** (item.attempts - 1)
+            item.retry_after = (datetime.datetime.now() + 
+                                datetime.timedelta(seconds=delay))
+            item.save()
+            stats.retrying += 1
+    return stats
+
+class Batch(object):
+    """
+    Queued changes to objects of one model, made with at most one update and
+    one removal request to the search engine.
+
+    ``objects`` maps the primary key of each object to its queued changes.
+    """
+    def __init__(self, index, objects):
+        self.index = index
+        self.objects = objects
+        self.items = []
+        for items in objects.values():
+            self.items.extend(items)
+        self.error = None
+
+    def run(self):
+        index = self.index
+        objects = index.get_query_set().in_bulk(self.objects.keys())
+        updated, removed = [], []
+        for pk in self.objects:
+            obj = objects.get(pk)
+            if obj is not None and index.should_index(obj):
+                updated.append(obj)
+            else:
+                removed.append(index.model(pk=pk))
+        index.update_objects(updated)
+        index.remove_objects(removed)
+
+def _make_batches(items, batch_size):
+    """
+    Groups queued changes by object into Batches, returning them with a list
+    of the changes for objects that can no longer be indexed.
+    """
+    from djangosearch.indexer import get_indexer
+    by_index, unknown = {}, []
+    for item in items:
+        model = get_model(*item.model.split('.', 1))
+        try:
+            index = get_indexer(model)
+            pk = model._meta.pk.to_python(item.object_id)
+        except (KeyError, ValidationError):
+            unknown.append(item)
+            continue
+        by_index.setdefault(index, {}).setdefault(pk, []).append(item)
+
+    batches = []
+    for index, objects in by_index.items():
+        pks = objects.keys()
+        for start in range(0, len(pks), batch_size):
+            batches.append(Batch(index, dict([(pk, objects[pk]) 
+                for pk in pks[start:start + batch_size]])))
+    return batches, unknown
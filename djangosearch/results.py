@@ -1,23 +1,69 @@
+import sys
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from djangosearch import background, caching
+
+# The number of results fetched from the engine at a time when iterating.
+CHUNK_SIZE = getattr(settings, 'SEARCH_RESULTS_CHUNK_SIZE', 100)
+
+# Whether to remove objects from the index when they are found to have been
+# deleted from the database.
+REMOVE_DELETED = getattr(settings, 'SEARCH_REMOVE_DELETED', False)
+
+# Whether to load the objects for each model in the results at the same time,
+# in a pool of threads with their own database connections.
+CONCURRENT_LOADING = getattr(settings, 'SEARCH_CONCURRENT_LOADING', False)
+
+# Whether to fetch the next page of results into the results cache in the
+# background after fetching a page, and how many pages can be being fetched
+# like this at once.
+PREFETCH_NEXT_PAGE = getattr(settings, 'SEARCH_PREFETCH_NEXT_PAGE', False)
+PREFETCH_LIMIT = getattr(settings, 'SEARCH_PREFETCH_LIMIT', 10)
 
 class SearchResults(object):
     """
     Encapsulates some search results from a backend.
     
     Expects to be initalized with a SearchQuery instance.
+
+    Results are fetched from the engine and loaded from the database a chunk
+    at a time as they are iterated over, so only the part of the results
+    actually used is loaded.
     """
     def __init__(self, query):
         self.query = query
-        from djangosearch.backends import backend
-        self.engine = backend.SearchEngine()
+        from djangosearch.backends import get_engine
+        self.engine = get_engine()
         
         self._raw_cache = None
         self._result_cache = None
+        self._iter = None
+        self._counts = {}
+        # Raw results being fetched in the background, as a list of
+        # (fields, low_mark, high_mark, future). Shared with clones.
+        self._windows = []
+        
+        # Options for the QuerySets used to load the objects.
+        self._only = self._defer = ()
+        self._select_related = False
         
     def __iter__(self):
-        return iter(self._get_results())
+        if self._result_cache is None:
+            self._iter = self.iterator()
+            self._result_cache = []
+        if self._iter:
+            return self._result_iter()
+        return iter(self._result_cache)
     
     def __len__(self):
-        return len(self._get_results())
+        """
+        Returns the number of results, without loading them (see count()).
+        """
+        if self._result_cache is not None and not self._iter:
+            return len(self._result_cache)
+        return self.count()
     
     def __getitem__(self, k):
         """Get an item or slice from the result set."""
@@ -27,6 +73,20 @@ class SearchResults(object):
             or (isinstance(k, slice) and (k.start is None or k.start >= 0) and (k.stop is None or k.stop >= 0)), \
             "Negative indexing is not supported."
         if self._result_cache is not None:
+            if self._iter is not None:
+                # The result cache has only been partially filled, so we may
+                # need to fill it out a bit more.
+                if isinstance(k, slice):
+                    if k.stop is not None:
+                        bound = int(k.stop)
+                    else:
+                        bound = None
+                else:
+                    bound = k + 1
+                if bound is None:
+                    self._fill_cache()
+                elif len(self._result_cache) < bound:
+                    self._fill_cache(bound - len(self._result_cache))
             return self._result_cache[k]
         if isinstance(k, slice):
             obj = self._clone()
@@ -39,13 +99,14 @@ class SearchResults(object):
             else:
                 stop = None
             obj.query.set_limits(start, stop)
-            return k.step and list(obj)[::k.step] or obj
+            return k.step and obj._get_results()[::k.step] or obj
+        self._fetch_chunk_containing(k)
         obj = self._clone()
         obj.query.set_limits(k, k+1)
-        return list(obj)[0]
+        return obj._get_results()[0]
     
     def __repr__(self):
-        return repr(list(self))
+        return repr(self._get_results())
     
     # Methods that return SearchResults
     def all(self):
@@ -55,64 +116,617 @@ class SearchResults(object):
         """
         return self._clone()
     
+    def values(self, *fields):
+        """
+        Returns a new SearchResults that yields a dictionary for each result
+        instead of an object, without using the database. The dictionaries
+        have ``model``, ``pk`` and ``relevance`` keys, along with any of the
+        given fields that are stored in the index.
+        """
+        return self._clone(klass=ValuesSearchResults, setup=True,
+                           _fields=fields)
+    
+    def values_list(self, *fields, **kwargs):
+        """
+        Like values(), but yields a tuple of the values of the given fields,
+        which can include ``model``, ``pk`` and ``relevance``. If ``flat`` is
+        True and there is only one field, yields the values themselves.
+        """
+        flat = kwargs.pop('flat', False)
+        if kwargs:
+            raise TypeError('Unexpected keyword arguments to values_list: %s'
+                    % (kwargs.keys(),))
+        if flat and len(fields) != 1:
+            raise TypeError("'flat' is not valid when values_list is called "
+                            "with more than one field.")
+        if not fields:
+            fields = HIT_KEYS
+        return self._clone(klass=ValuesListSearchResults, setup=True,
+                           _fields=fields, flat=flat)
+    
+    def only(self, *fields):
+        """
+        Returns a new SearchResults that only loads the given fields of the
+        objects from the database (see QuerySet.only()). Fields that a model
+        in the results doesn't have are ignored for that model.
+        """
+        return self._clone(_only=fields)
+    
+    def defer(self, *fields):
+        """
+        Returns a new SearchResults that doesn't load the given fields of the
+        objects until they are used (see QuerySet.defer()). Fields that a
+        model in the results doesn't have are ignored for that model.
+        """
+        return self._clone(_defer=fields)
+    
+    def select_related(self, *fields):
+        """
+        Returns a new SearchResults that loads related objects along with the
+        objects (see QuerySet.select_related()). Fields that a model in the
+        results doesn't have are ignored for that model.
+        """
+        return self._clone(_select_related=fields or True)
+    
     # Methods that don't return SearchResults
-    def count(self):
+    def count(self, approximate=False):
         """
         Returns the number of results.
         
         If the results are fully cached, the length of that will be returned. 
         Otherwise, the backend will retrieve the number of results in the most
         efficient way possible.
+
+        If ``approximate`` is True, the backend may return an estimate if that
+        is quicker, and a cached count may be used even if the index has 
+        changed since.
         """
-        if self._raw_cache:
+        if self._raw_cache is not None:
             return len(self._raw_cache)
-        try:
-            return self.engine.get_count(self.query)
-        except NotImplementedError:
-            return len(self._get_results())
+        total = self._total_count(approximate)
+        if total is None:
+            return len(self.raw())
+        if self.query.high_mark is not None:
+            total = min(total, self.query.high_mark)
+        return max(total - self.query.low_mark, 0)
     
+    def iterator(self, chunk_size=None):
+        """
+        An iterator over the results that doesn't cache them. Results are
+        fetched from the engine and loaded from the database ``chunk_size``
+        at a time, so memory use doesn't grow with the number of results.
+        """
+        found = missing = 0
+        for chunk in self._iter_raw_chunks(chunk_size or CHUNK_SIZE):
+            objects = self._load_objects(chunk)
+            found += len(chunk)
+            missing += len(chunk) - len(objects)
+            for obj in objects:
+                yield obj
+        # Objects that have been deleted since they were indexed leave a
+        # slice short, so make up the shortfall with the hits following it.
+        low, high = self.query.low_mark, self.query.high_mark
+        if high is None or found < high - low:
+            return
+        while missing:
+            chunk = self._fetch(
+                        self.query.clone(low_mark=high, high_mark=high + missing))
+            objects = self._load_objects(chunk)
+            for obj in objects:
+                yield obj
+            if len(chunk) < missing:
+                break
+            high += missing
+            missing -= len(objects)
+
     def raw(self):
         """
-        Returns results as a list of dictionaries with 'model', 'pk' and 
-        'relevance' keys.
+        Returns results as a list of Hit objects, with 'model', 'pk' and 
+        'relevance' attributes.
         """
         if self._raw_cache is None:
-            self._raw_cache = self.engine.get_results(self.query)
+            # Results sliced from ones already fetched, such as by index, 
+            # aren't a page anyone is reading through.
+            prefetch = (PREFETCH_NEXT_PAGE and 
+                        self._find_window(self.query) is None)
+            self._raw_cache = self._fetch(self.query, keep=True)
+            if prefetch:
+                self._prefetch_next_page()
         return self._raw_cache
     
+    def araw(self):
+        """
+        Starts fetching raw() in the background, and returns a 
+        djangosearch.background.Future for it. Using the results waits for
+        it to finish.
+        """
+        if self._raw_cache is not None:
+            return background.completed(self._raw_cache)
+        return self._fetch_async(self.query)
+    
+    def acount(self, approximate=False):
+        """
+        Starts working out count() in the background, and returns a
+        djangosearch.background.Future for it.
+        """
+        return background.submit(self.count, approximate)
+    
+    def prefetch(self):
+        """
+        Starts fetching the first chunk of results in the background, so they
+        are ready when they are used.
+        """
+        low, high = self.query.low_mark, self.query.high_mark
+        if high is None or high - low > CHUNK_SIZE:
+            high = low + CHUNK_SIZE
+        self._fetch_async(self.query.clone(low_mark=low, high_mark=high))
+    
     # Private methods
     def _get_results(self):
         """
-        Returns a list of result objects.
+        Returns a list of all the result objects.
         """
         if self._result_cache is None:
-            model_pks = {}
-            for result in self.raw():
-                model_pks.setdefault(result['model'], []).append(result['pk'])
-            loaded_objects = {}
-            for model in model_pks:
-                loaded_objects[model] = model._default_manager.in_bulk(
-                                            model_pks[model])
+            self._iter = self.iterator()
             self._result_cache = []
-            for result in self.raw():
-                # We have to deal with integer keys being cast from strings; 
-                # if this fails we've got a character pk.
+        self._fill_cache()
+        return self._result_cache
+
+    def _result_iter(self):
+        pos = 0
+        while 1:
+            upper = len(self._result_cache)
+            while pos < upper:
+                yield self._result_cache[pos]
+                pos = pos + 1
+            if not self._iter:
+                raise StopIteration
+            if len(self._result_cache) <= pos:
+                self._fill_cache(CHUNK_SIZE)
+
+    def _fill_cache(self, num=None):
+        """
+        Fills the result cache with ``num`` more results, or all of them if
+        ``num`` is None.
+        """
+        if self._iter:
+            try:
+                if num is None:
+                    self._result_cache.extend(self._iter)
+                    self._iter = None
+                else:
+                    for i in range(num):
+                        self._result_cache.append(self._iter.next())
+            except StopIteration:
+                self._iter = None
+
+    def _iter_raw_chunks(self, chunk_size):
+        """
+        Yields the raw results in lists of at most ``chunk_size``, fetching
+        them from the engine a chunk at a time unless they are already cached.
+        """
+        if self._raw_cache is not None:
+            for i in range(0, len(self._raw_cache), chunk_size):
+                yield self._raw_cache[i:i + chunk_size]
+            return
+        low, high = self.query.low_mark, self.query.high_mark
+        if high is not None and high - low <= chunk_size:
+            # A page that fits in one chunk; this is the same as raw().
+            yield self.raw()
+            return
+        while high is None or low < high:
+            rows = chunk_size
+            if high is not None:
+                rows = min(rows, high - low)
+            chunk = self._fetch(
+                        self.query.clone(low_mark=low, high_mark=low + rows))
+            if chunk:
+                yield chunk
+            if len(chunk) < rows:
+                break
+            low += rows
+
+    def _total_count(self, approximate=False):
+        """
+        Returns the number of results without any limits, or None if the
+        engine can't count them. Counts are shared with clones.
+        """
+        if False in self._counts:
+            return self._counts[False]
+        if approximate not in self._counts:
+            query = self.query.clone(low_mark=0, high_mark=None, fields=None)
+            count = caching.get_count(query, approximate)
+            if count is None:
                 try:
-                    pk = int(result['pk'])
-                except ValueError:
-                    pk = result['pk']
+                    if approximate:
+                        count = self.engine.get_approximate_count(query)
+                    else:
+                        count = self.engine.get_count(query)
+                except NotImplementedError:
+                    return None
+                caching.set_count(query, count, approximate)
+            self._counts[approximate] = count
+        return self._counts[approximate]
+
+    def _fetch(self, query, keep=False):
+        """
+        Gets the raw results for a query from the results cache if they are
+        there, or from the engine.
+
+        If ``keep`` is True, the results are kept for this SearchResults and
+        its clones to use when fetching the same query or any slice of it.
+        """
+        window = self._find_window(query)
+        while window is not None:
+            low, future = window
+            try:
+                results = future.result()
+            except Exception:
+                # The results failed to fetch in the background. Forget them,
+                # so that this and later fetches go to the engine again
+                # rather than repeating the same error.
+                self._forget_window(future)
+                window = self._find_window(query)
+                continue
+            if query.high_mark is None:
+                return results[query.low_mark - low:]
+            return results[query.low_mark - low:query.high_mark - low]
+        results = caching.get_results(query)
+        if results is None:
+            results = self.engine.get_results(query)
+            caching.set_results(query, results)
+        elif isinstance(results, caching.Prefetched):
+            prefetch_stats.record('used')
+            results = list(results)
+            caching.set_results(query, results)
+        if keep:
+            self._windows.append((query.fields, query.low_mark, 
+                                  query.high_mark, 
+                                  background.completed(results)))
+        return results
+
+    def _find_window(self, query):
+        """
+        Returns the low mark and Future of the kept results that a query is a
+        slice of, or None.
+        """
+        for fields, low, high, future in self._windows:
+            if (fields == query.fields and low <= query.low_mark and
+                    (high is None or (query.high_mark is not None and
+                                      query.high_mark <= high))):
+                return low, future
+        return None
+
+    def _forget_window(self, future):
+        # Change the list in place, as it is shared with clones.
+        self._windows[:] = [window for window in self._windows
+                            if window[3] is not future]
+
+    def _fetch_chunk_containing(self, k):
+        """
+        Fetches and keeps the chunk of raw results containing the kth result,
+        unless it has been already, so that getting the results around it
+        by index doesn't need a request to the engine for each one.
+        """
+        low = self.query.low_mark + k
+        for fields, window_low, window_high, future in self._windows:
+            if (fields == self.query.fields and window_low <= low and
+                    (window_high is None or low < window_high)):
+                return
+        low = self.query.low_mark + k - k % CHUNK_SIZE
+        high = low + CHUNK_SIZE
+        if self.query.high_mark is not None:
+            high = min(high, self.query.high_mark)
+        if low < high:
+            self._fetch(self.query.clone(low_mark=low, high_mark=high), 
+                        keep=True)
+
+    def _fetch_async(self, query):
+        """
+        Starts fetching the raw results for a query in the background, and
+        returns a Future for them. _fetch() then waits for them instead of
+        fetching the same query, or any slice of it, again.
+        """
+        results = caching.get_results(query)
+        if results is not None:
+            future = background.completed(results)
+        else:
+            future = self.engine.get_results_async(query)
+            def cache_results(future):
                 try:
-                    self._result_cache.append(
-                            loaded_objects[result['model']][pk])
-                except KeyError:
-                    # The object must have been deleted since we indexed; 
-                    # fail silently. Unfortunately this will mean missing
-                    # search results when paginating.
-                    continue
-        return self._result_cache
+                    caching.set_results(query, future.result())
+                except Exception:
+                    # Whoever uses the results will get the exception.
+                    pass
+            future.add_done_callback(cache_results)
+        self._windows.append((query.fields, query.low_mark, query.high_mark,
+                              future))
+        return future
+
+    def _prefetch_next_page(self):
+        """
+        Starts fetching the page after this one into the results cache in the
+        background, unless this is the last page or a single result.
+        """
+        low, high = self.query.low_mark, self.query.high_mark
+        if (not caching.TIMEOUT or high is None or high - low <= 1 or
+                len(self._raw_cache) < high - low):
+            return
+        query = self.query.clone(low_mark=high, high_mark=high + high - low)
+        if caching.get_results(query) is not None:
+            return
+        if not _prefetch_slots.acquire(False):
+            prefetch_stats.record('dropped')
+            return
+        prefetch_stats.record('started')
+        def cache_results(future):
+            _prefetch_slots.release()
+            try:
+                caching.set_results(query, caching.Prefetched(future.result()))
+            except Exception:
+                # Nobody is waiting for these results, so there's no one to
+                # report the error to; the page will be fetched again when
+                # it is needed.
+                pass
+        self.engine.get_results_async(query).add_done_callback(cache_results)
+
+    def _load_objects(self, raw):
+        """
+        Returns a list of the objects for a list of raw results.
+        """
+        model_pks = {}
+        for hit in raw:
+            model_pks.setdefault(hit.model, []).append(hit.pk)
+        if (CONCURRENT_LOADING and len(model_pks) > 1 and 
+                _can_load_concurrently()):
+            loaded_objects = _in_bulk_concurrently(model_pks,
+                                                   self._get_query_set)
+        else:
+            loaded_objects = {}
+            for model in model_pks:
+                loaded_objects[model] = self._get_query_set(model).in_bulk(
+                                            model_pks[model])
+        objects, deleted = [], []
+        for hit in raw:
+            try:
+                objects.append(loaded_objects[hit.model][hit.pk])
+            except KeyError:
+                # The object must have been deleted since we indexed.
+                deleted.append(hit.model(pk=hit.pk))
+        if deleted and REMOVE_DELETED:
+            _remove_deleted(deleted)
+        return objects
+    
+    def _get_query_set(self, model):
+        """
+        Returns the QuerySet used to load objects of the given model.
+        """
+        qs = model._default_manager.all()
+        names = [f.name for f in model._meta.fields]
+        def own(fields):
+            return [f for f in fields if f.split('__')[0] in names]
+        if self._select_related is True:
+            qs = qs.select_related()
+        elif self._select_related and own(self._select_related):
+            qs = qs.select_related(*own(self._select_related))
+        if own(self._only):
+            qs = qs.only(*own(self._only))
+        if own(self._defer):
+            qs = qs.defer(*own(self._defer))
+        return qs
     
-    def _clone(self, **kwargs):
-        c = self.__class__(query=self.query.clone())
+    def _clone(self, klass=None, setup=False, **kwargs):
+        if klass is None:
+            klass = self.__class__
+        c = klass(query=self.query.clone())
         c.engine = self.engine
+        c._counts = self._counts
+        c._windows = self._windows
+        c._only, c._defer = self._only, self._defer
+        c._select_related = self._select_related
         c.__dict__.update(kwargs)
+        if setup and hasattr(c, '_setup_query'):
+            c._setup_query()
         return c
+
+class PrefetchStats(object):
+    """
+    Counts how many pages have been prefetched with SEARCH_PREFETCH_NEXT_PAGE
+    by this process, how many were not because SEARCH_PREFETCH_LIMIT pages
+    were already being prefetched, and how many prefetched pages were used.
+    """
+    def __init__(self):
+        self.started = self.dropped = self.used = 0
+        self._lock = threading.Lock()
+
+    def record(self, name):
+        self._lock.acquire()
+        try:
+            setattr(self, name, getattr(self, name) + 1)
+        finally:
+            self._lock.release()
+
+    def __repr__(self):
+        return '<PrefetchStats: %d started, %d dropped, %d used>' % (
+                    self.started, self.dropped, self.used)
+
+prefetch_stats = PrefetchStats()
+_prefetch_slots = threading.Semaphore(PREFETCH_LIMIT)
+
+class Hit(object):
+    """
+    A result from the search engine, as returned by SearchEngine.get_results()
+    and SearchResults.raw().
+
+    ``pk`` is converted to the type of the model's primary key. ``fields`` is
+    a dictionary of the values stored in the index, if they were asked for.
+    Hits can also be used as dictionaries with ``model``, ``pk``,
+    ``relevance`` and ``fields`` keys.
+    """
+    # There can be a great many of these, so they are kept small.
+    __slots__ = ('model', 'pk', 'relevance', 'fields')
+
+    def __init__(self, model, pk, relevance=None, fields=None):
+        self.model = model
+        try:
+            self.pk = _pk_types[model](pk)
+        except KeyError:
+            self.pk = _pk_type(model)(pk)
+        self.relevance = relevance
+        self.fields = fields
+
+    def __repr__(self):
+        return '<Hit: %s.%s %r>' % (self.model._meta.app_label,
+                                    self.model._meta.object_name, self.pk)
+
+    def __eq__(self, other):
+        return (isinstance(other, Hit) and 
+                self.__getstate__() == other.__getstate__())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    # Classes with __slots__ need these to be pickled, which they are when
+    # results are cached.
+    def __getstate__(self):
+        return (self.model, self.pk, self.relevance, self.fields)
+
+    def __setstate__(self, state):
+        self.model, self.pk, self.relevance, self.fields = state
+
+_pk_types = {}
+def _pk_type(model):
+    """
+    Returns a function converting primary keys from the search engine to the
+    type of the model's primary key.
+    """
+    pk = model._meta.pk
+    # Following relations to the primary key a OneToOneField refers to.
+    while pk.rel:
+        pk = pk.rel.get_related_field()
+    if pk.get_internal_type() in ('AutoField', 'IntegerField', 
+                                  'PositiveIntegerField', 'BigIntegerField',
+                                  'SmallIntegerField', 
+                                  'PositiveSmallIntegerField'):
+        # Much quicker than to_python().
+        convert = int
+    else:
+        convert = pk.to_python
+    _pk_types[model] = convert
+    return convert
+
+# The attributes of each Hit that values() and values_list() can return, not
+# counting stored fields.
+HIT_KEYS = ('model', 'pk', 'relevance')
+
+class ValuesSearchResults(SearchResults):
+    """
+    SearchResults that yields dictionaries of the values stored in the index
+    instead of objects loaded from the database.
+    """
+    def _setup_query(self):
+        """
+        Asks the engine for the stored fields needed.
+        """
+        self.query.fields = [f for f in self._fields if f not in HIT_KEYS]
+    
+    def _load_objects(self, raw):
+        return [self._make_values(hit) for hit in raw]
+    
+    def _make_values(self, hit):
+        values = {'model': hit.model, 'pk': hit.pk, 'relevance': hit.relevance}
+        if hit.fields:
+            values.update(hit.fields)
+        return values
+    
+    def _clone(self, klass=None, setup=False, **kwargs):
+        kwargs.setdefault('_fields', self._fields)
+        return super(ValuesSearchResults, self)._clone(klass, setup, **kwargs)
+
+class ValuesListSearchResults(ValuesSearchResults):
+    """
+    SearchResults that yields tuples of the values stored in the index instead
+    of objects loaded from the database.
+    """
+    def _make_values(self, hit):
+        values = super(ValuesListSearchResults, self)._make_values(hit)
+        if self.flat:
+            return values.get(self._fields[0])
+        return tuple([values.get(field) for field in self._fields])
+    
+    def _clone(self, klass=None, setup=False, **kwargs):
+        kwargs.setdefault('flat', self.flat)
+        return super(ValuesListSearchResults, self)._clone(klass, setup,
+                                                           **kwargs)
+
+def _remove_deleted(objects):
+    """
+    Removes objects that have been deleted from the database from the index,
+    a model at a time, without making the search wait for it.
+    """
+    from djangosearch.indexer import get_indexer
+    model_objects = {}
+    for obj in objects:
+        model_objects.setdefault(obj.__class__, []).append(obj)
+    for model, objs in model_objects.items():
+        try:
+            index = get_indexer(model)
+        except KeyError:
+            continue
+        index.remove_objects_later(objs)
+
+def _can_load_concurrently():
+    # Each thread connecting to an in-memory SQLite database gets a new,
+    # empty database.
+    if (settings.DATABASE_ENGINE == 'sqlite3' 
+            and settings.DATABASE_NAME in ('', ':memory:')):
+        return False
+    # Other connections can't see what this thread's transaction hasn't
+    # committed yet.
+    return not (transaction.is_managed() or transaction.is_dirty())
+
+# The threads that load objects for concurrent loading. They keep their
+# database connections between searches, so each search doesn't have to
+# connect again.
+_loading_pool = background.Pool(background.THREADS, keep_connections=True)
+
+def _in_bulk_concurrently(model_pks, get_query_set):
+    """
+    Takes a dictionary mapping models to lists of primary keys, and returns a
+    dictionary mapping each model to the result of in_bulk() on the QuerySet
+    get_query_set() returns for it. The lookup for each model but the last is
+    run in one of the loading pool's threads, with its own database
+    connection.
+    """
+    items = model_pks.items()
+    futures = [(model, _loading_pool.submit(get_query_set(model).in_bulk, pks))
+               for model, pks in items[:-1]]
+    loaded_objects = {}
+    model, pks = items[-1]
+    try:
+        loaded_objects[model] = get_query_set(model).in_bulk(pks)
+    finally:
+        # Wait for all the lookups, even if one failed, then raise the first
+        # error.
+        results = []
+        for model, future in futures:
+            try:
+                results.append((model, future.result(), None))
+            except Exception:
+                results.append((model, None, sys.exc_info()))
+    for model, objects, exc_info in results:
+        if exc_info:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        loaded_objects[model] = objects
+    return loaded_objects
@@ -53,7 +53,12 @@ if settings.SEARCH_ENGINE in backends:
 else:
     backend_tests = None
 
-__test__ = {'API_TESTS': tests}
+from djangosearch.tests import query as query_tests
+from djangosearch.tests import results as results_tests
+from djangosearch.tests import indexing as indexing_tests
+
+__test__ = {'API_TESTS': tests, 'QUERY_TESTS': query_tests,
+            'RESULTS_TESTS': results_tests, 'INDEXING_TESTS': indexing_tests}
 
 if backend_tests:
     __test__['BACKEND_TESTS'] = backend_tests
@@ -0,0 +1,223 @@
+"""
+Tests for keeping the index up to date as objects are saved and deleted.
+
+>>> from datetime import datetime
+>>> from djangosearch import batching
+>>> from djangosearch.tests import Article
+>>> from djangosearch.tests.results import RecordingEngine
+
+>>> engine = RecordingEngine()
+>>> Article.index._engine = engine
+
+# Without SEARCH_BATCH_UPDATES, each change is made straight away.
+
+>>> a = Article.objects.create(title='one', date=datetime(2008, 1, 1))
+>>> engine.requests
+['update one']
+
+# With it, changes are buffered and made a model at a time, keeping only the
+# last change to each object.
+
+>>> batching.BATCH_UPDATES = True
+>>> engine.requests = []
+>>> a.title = 'one again'
+>>> a.save()
+>>> b = Article.objects.create(title='two', date=datetime(2008, 1, 1))
+>>> b_pk = b.pk
+>>> c = Article.objects.create(title='three', date=datetime(2008, 1, 1))
+>>> b.delete()
+>>> engine.requests, len(batching.buffer)
+([], 3)
+>>> batching.flush()
+>>> engine.requests == ['update one again, three', 'remove %s' % b_pk]
+True
+>>> len(batching.buffer)
+0
+
+# The buffer is flushed at the end of each request, and when it is full.
+
+>>> from django.core.signals import request_finished
+>>> engine.requests = []
+>>> a.save()
+>>> responses = request_finished.send(sender=None)
+>>> engine.requests
+['update one again']
+
+>>> batching.BATCH_SIZE = 2
+>>> engine.requests = []
+>>> a.save()
+>>> a.save()
+>>> engine.requests
+[]
+>>> c.save()
+>>> engine.requests
+['update one again, three']
+>>> batching.BATCH_SIZE = 1000
+
+# If the engine fails, the changes it didn't make are kept to try again,
+# and the others are still made. Flushing at the end of a request doesn't
+# raise the error.
+
+>>> def fail(*args):
+...     raise IOError('Search engine down')
+>>> engine.requests = []
+>>> engine.update = fail
+>>> a.save()
+>>> b = Article.objects.create(title='two', date=datetime(2008, 1, 1))
+>>> b_pk = b.pk
+>>> b.delete()
+>>> batching.flush()
+Traceback (most recent call last):
+    ...
+IOError: Search engine down
+>>> engine.requests == ['remove %s' % b_pk], len(batching.buffer)
+(True, 1)
+>>> responses = request_finished.send(sender=None)
+>>> len(batching.buffer)
+1
+>>> del engine.update
+>>> batching.flush()
+>>> engine.requests == ['remove %s' % b_pk, 'update one again']
+True
+
+>>> batching.BATCH_UPDATES = False
+
+# With SEARCH_INDEX_ON_COMMIT, changes made in a transaction are made when it
+# is committed, and not at all if it is rolled back.
+
+>>> from django.db import transaction
+>>> batching.INDEX_ON_COMMIT = True
+>>> engine.requests = []
+>>> transaction.enter_transaction_management()
+>>> transaction.managed(True)
+>>> d = Article.objects.create(title='four', date=datetime(2008, 1, 1))
+>>> a.save()
+>>> engine.requests
+[]
+>>> transaction.commit()
+>>> engine.requests
+['update one again, four']
+
+>>> engine.requests = []
+>>> d.delete()
+>>> e = Article.objects.create(title='five', date=datetime(2008, 1, 1))
+>>> transaction.rollback()
+>>> engine.requests, len(batching.transaction_buffer)
+([], 0)
+
+# If the changes fail after a commit, the commit still succeeds, and the
+# changes are tried again with the other buffered changes.
+
+>>> engine.update = fail
+>>> a.save()
+>>> transaction.commit()
+>>> len(batching.transaction_buffer), len(batching.buffer)
+(0, 1)
+>>> del engine.update
+>>> batching.flush()
+>>> engine.requests
+['update one again']
+>>> transaction.leave_transaction_management()
+>>> engine.requests = []
+
+# Outside a transaction, changes are made straight away.
+
+>>> d.save()
+>>> engine.requests
+['update four']
+>>> batching.INDEX_ON_COMMIT = False
+
+# With SEARCH_QUEUE_UPDATES, changes are queued in the database and made by
+# the run_index_worker command, once for each object however many times it
+# changed.
+
+>>> from djangosearch import queueing
+>>> from djangosearch.models import QueuedUpdate
+>>> queueing.QUEUE_UPDATES = True
+>>> engine.requests = []
+>>> a.save()
+>>> a.save()
+>>> e = Article.objects.create(title='five', date=datetime(2008, 1, 1))
+>>> e_pk = e.pk
+>>> e.delete()
+>>> engine.requests, QueuedUpdate.objects.count()
+([], 4)
+>>> queueing.run_once()
+<Stats: 4 done, 0 retrying, 0 failed>
+>>> engine.requests == ['update one again', 'remove %s' % e_pk]
+True
+>>> QueuedUpdate.objects.count()
+0
+
+>>> from django.core.management import call_command
+>>> engine.requests = []
+>>> d.save()
+>>> call_command('run_index_worker', once=True, verbosity=0)
+>>> engine.requests == ['update four'], QueuedUpdate.objects.count()
+(True, 0)
+
+# Changes that fail are retried later, and given up on after a number of
+# attempts.
+
+>>> def fail(*args):
+...     raise IOError('Search engine down')
+>>> engine.update = fail
+>>> d.save()
+>>> queueing.run_once(retries=2)
+<Stats: 0 done, 1 retrying, 0 failed>
+>>> item = QueuedUpdate.objects.get()
+>>> item.attempts, item.retry_after > datetime.now()
+(1, True)
+>>> queueing.run_once(retries=2)
+<Stats: 0 done, 0 retrying, 0 failed>
+>>> item.retry_after = datetime.now()
+>>> item.save()
+>>> queueing.run_once(retries=2)
+<Stats: 0 done, 0 retrying, 1 failed>
+>>> QueuedUpdate.objects.count()
+0
+>>> del engine.update
+>>> queueing.QUEUE_UPDATES = False
+
+# Reindexing stops cached results for the reindexed models from being used.
+
+>>> from djangosearch import caching
+>>> from djangosearch.tests import Event
+>>> Event.index._engine = engine
+>>> caching.TIMEOUT = 60
+>>> generations = caching._generations([Article])
+>>> call_command('reindex', 'djangosearch', verbosity=0)
+>>> caching._generations([Article]) != generations
+True
+>>> caching.TIMEOUT = 0
+>>> Event.index._engine = None
+
+# The index template for a model is only looked for once, even when there
+# isn't one, until the cache is cleared.
+
+>>> from django.template import loader, Template
+>>> from djangosearch.indexer import clear_template_caches
+>>> lookups = []
+>>> def get_template(name):
+...     lookups.append(name)
+...     return real_get_template(name)
+>>> real_get_template, loader.get_template = loader.get_template, get_template
+>>> Article.index.clear_template_cache()
+>>> print Article.index.flatten(a), Article.index.flatten(a)
+one again one again
+>>> lookups
+['djangosearch/article_index.txt']
+
+>>> loader.get_template = lambda name: Template('Title: {{ object.title }}')
+>>> print Article.index.flatten(a)
+one again
+>>> clear_template_caches()
+>>> print Article.index.flatten(a)
+Title: one again
+>>> loader.get_template = real_get_template
+>>> Article.index.clear_template_cache()
+
+>>> Article.index._engine = False
+>>> Article.objects.filter(title__in=['one again', 'three', 'four']).delete()
+>>> Article.index._engine = None
+"""
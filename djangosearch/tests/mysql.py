@@ -5,4 +5,6 @@
 >>> convert_new('(video or pictures) -(sports news) "train times" foo -boring title:foo', QueryConverter)
 ('+(video pictures) -(sports news) "train times" +foo -boring', {'title': 'foo'})
 
+>>> convert_new('djan* -foo*', QueryConverter)
+('+djan* -foo*', {})
 """
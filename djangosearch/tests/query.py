@@ -0,0 +1,170 @@
+"""
+Tests for the common query format parser, which don't depend on a backend.
+
+>>> from djangosearch.query import *
+>>> from djangosearch.query import _event_generator, _make_parser, _make_pyparsing_parser, _shape
+
+>>> list(parse('django rocks author:jacob'))
+[('term', 'django'), ('term', 'rocks'), ('start', 'field'), ('start', 'fieldname'), ('term', 'author'), ('end', 'fieldname'), ('term', 'jacob'), ('end', 'field')]
+
+>>> list(parse('a or b or c'))
+[('start', 'or'), ('term', 'a'), ('start', 'or'), ('term', 'b'), ('term', 'c'), ('end', 'or'), ('end', 'or')]
+
+>>> list(parse('-"train times"'))
+[('start', 'not'), ('start', 'quotes'), ('term', 'train'), ('term', 'times'), ('end', 'quotes'), ('end', 'not')]
+
+# Anything after the first unparseable part of the query is ignored, as it
+# always was with pyparsing.
+>>> list(parse('foo (bar'))
+[('term', 'foo')]
+
+>>> list(parse('('))
+Traceback (most recent call last):
+    ...
+ParseError: Could not parse '(' (at char 0)
+
+# The hand-written parser must agree with the pyparsing grammar it replaced.
+>>> parser, old = _make_parser(), _make_pyparsing_parser()
+>>> new = lambda q: list(_event_generator(parser(q)))
+>>> queries = ['a or b c', 'a or', 'or a', '--x', 'x -', 'foo-bar', "'a b'",
+...            'a "b', 't: f', 't:-f', 't:(a b)', 'a:b:c', '-t:f', 'a or or',
+...            '(a or b) or c', 'a OR b', 'a or(b)', '"a or b"', 'x:',
+...            't_x:y', 'a.b:c', 'a or$', 'a or_b', '(a)(b)', 'a"b"',
+...            'a or b or (c', u'caf\xe9 cr\xe8me']
+>>> [q for q in queries if new(q) != old(q)]
+[]
+
+# A "*" straight after a word makes it a prefix.
+>>> list(parse('djan* -"web framework"'))
+[('start', 'prefix'), ('term', 'djan'), ('end', 'prefix'), ('start', 'not'), ('start', 'quotes'), ('term', 'web'), ('term', 'framework'), ('end', 'quotes'), ('end', 'not')]
+>>> parse_tree('djan* -foo* title:ba*')
+And((Prefix('djan'), Not(Prefix('foo')), Field('title', Prefix('ba'))))
+>>> convert('djan* -foo*', BaseQueryConverter)
+'djan* -foo*'
+
+# Queries are parsed into trees of immutable nodes.
+>>> tree = parse_tree('(video or pictures) -"train times" title:foo')
+>>> tree
+And((Group(Or((Term('video'), Term('pictures')))), Not(Phrase(('train', 'times'))), Field('title', Term('foo'))))
+>>> tree == parse_tree('(video or pictures)  -"train times"  title:foo')
+True
+>>> tree.children = ()
+Traceback (most recent call last):
+    ...
+AttributeError: And nodes are immutable
+>>> len(set([Term('a'), Term('a'), Term('b')]))
+2
+
+>>> class TermCollector(NodeVisitor):
+...     def __init__(self):
+...         self.terms = []
+...     def visit_term(self, node):
+...         self.terms.append(node.text)
+>>> collector = TermCollector()
+>>> collector.visit(tree)
+>>> collector.terms
+['video', 'pictures', 'foo']
+
+# Field restrictions are taken out of the query by convert_new.
+>>> convert_new('t:"a b" x', BaseQueryConverter)
+('x', {'t': 'a b'})
+>>> convert_new('x or t:a', BaseQueryConverter)
+('x', {'t': 'a'})
+>>> convert_new('t:a', BaseQueryConverter)
+('', {'t': 'a'})
+
+# Parsed queries are simplified before they are converted.
+>>> optimizer = QueryOptimizer(stopwords=['the', 'of'])
+>>> def simplify(q):
+...     c = BaseQueryConverter()
+...     c.visit(optimizer.optimize(parse_tree(q)))
+...     return str(c)
+>>> simplify('django django rocks')
+'django rocks'
+>>> simplify('((django rocks) (python))')
+'django rocks python'
+>>> simplify('django or django')
+'django'
+>>> simplify('(a or (b or c)) or a')
+'a or b or c'
+>>> simplify('-(-django)')
+'django'
+>>> simplify('django title:rocks')
+'title:rocks django'
+>>> simplify('the lord of the rings -the title:the')
+'title:the lord rings'
+>>> simplify('the')
+'the'
+
+# Queries over the size and complexity limits are rejected before parsing.
+>>> check_query('django ' * 101)
+Traceback (most recent call last):
+    ...
+QueryTooComplex: Queries can't have more than 100 terms.
+>>> parse_tree('x' * 1001)
+Traceback (most recent call last):
+    ...
+QueryTooComplex: Queries can't be longer than 1000 characters.
+>>> parse_tree('(' * 17 + 'django' + ')' * 17)
+Traceback (most recent call last):
+    ...
+QueryTooComplex: Brackets can't be nested more than 16 deep.
+>>> parse_tree(' or '.join(['django'] * 22))
+Traceback (most recent call last):
+    ...
+QueryTooComplex: Queries can't have more than 20 "or" clauses.
+>>> query_cost(parse_tree('django -"web framework"'))
+7
+>>> parse_tree(' '.join(['"%s %s"' % (i, i) for i in range(50)]))
+Traceback (most recent call last):
+    ...
+QueryTooComplex: The query is too complex.
+
+# Queries are converted by filling their terms into a template made from the
+# shape of the query, so queries of the same shape are only converted once.
+>>> terms = []
+>>> shape = _shape(parse_tree('django -"web framework"'), terms)
+>>> shape
+And((Term('\\x000\\x00'), Not(Phrase(('\\x001\\x00', '\\x002\\x00')))))
+>>> terms
+['django', 'web', 'framework']
+>>> template = QueryTemplate(shape, BaseQueryConverter)
+>>> template.render(['python', 'web', 'server'])
+'python -"web server"'
+>>> query_cache.clear()
+>>> convert('django -"web framework"', BaseQueryConverter)
+'django -"web framework"'
+>>> convert('python -"web server"', BaseQueryConverter)
+'python -"web server"'
+>>> query_cache.hits
+1
+
+# Converted queries are cached, least recently used first out.
+>>> from djangosearch.query import QueryCache
+>>> cache = QueryCache(2)
+>>> cache.set('a', 1)
+>>> cache.set('b', 2)
+>>> cache.get('a')
+1
+>>> cache.set('c', 3)
+>>> print cache.get('b')
+None
+>>> sorted(cache.stats().items())
+[('evictions', 1), ('hits', 1), ('max_size', 2), ('misses', 1), ('size', 2)]
+
+>>> cache = QueryCache(0)
+>>> cache.set('a', 1)
+>>> print cache.get('a')
+None
+
+>>> from djangosearch.query import query_cache, convert_new, BaseQueryConverter
+>>> query_cache.clear()
+>>> convert_new('foo title:bar', BaseQueryConverter)
+('foo', {'title': 'bar'})
+>>> converted, fields = convert_new('foo title:bar', BaseQueryConverter)
+>>> fields['title'] = 'baz'
+>>> convert_new('foo title:bar', BaseQueryConverter)
+('foo', {'title': 'bar'})
+>>> query_cache.hits, query_cache.misses
+(2, 3)
+"""
@@ -0,0 +1,343 @@
+"""
+Tests for SearchResults, using an engine that serves results for the
+articles it has indexed and records the requests made to it.
+
+>>> import os, tempfile
+>>> from datetime import datetime
+>>> from djangosearch.query import SearchQuery
+>>> from djangosearch.results import SearchResults
+>>> from djangosearch.tests import Article
+>>> from djangosearch.tests.results import RecordingEngine, wait_for
+
+# Don't send the test articles to the real search engine.
+>>> Article.index._engine = False
+>>> for i in range(250):
+...     a = Article.objects.create(title='article %d' % i,
+...                                date=datetime(2008, 1, 1))
+>>> RecordingEngine.indexed = list(Article.objects.filter(
+...     title__startswith='article ').values('pk', 'title'))
+
+>>> def search(q):
+...     results = SearchResults(SearchQuery(q))
+...     results.engine = RecordingEngine()
+...     return results
+
+# Getting the length of the results or a page of them only asks the engine
+# for what it needs.
+
+>>> results = search('article')
+>>> len(results)
+250
+>>> results.engine.requests
+['count']
+>>> page = results[20:30]
+>>> len(page), list(page)[0]
+(10, <Article: article 20>)
+>>> page.engine.requests
+['count', 'results 20:30']
+
+>>> from django.core.paginator import Paginator
+>>> results = search('article')
+>>> p = Paginator(results, 25).page(3)
+>>> len(p.object_list), list(p.object_list)[0]
+(25, <Article: article 50>)
+>>> results.engine.requests
+['count', 'results 50:75']
+
+# The count for a slice is worked out from the count for all the results,
+# which is shared with the other slices of the same results.
+
+>>> results = search('article')
+>>> results[240:300].count(), results[:10].count(), results[300:].count()
+(10, 10, 0)
+>>> results.engine.requests
+['count']
+
+# raw() returns the hits from the engine, with the primary keys converted to
+# the type of the model's primary key. They can be used as dictionaries too.
+
+>>> hit = search('article').raw()[0]
+>>> hit, hit.pk, hit['pk'], hit.get('relevance'), hit.get('score', 0)
+(<Hit: djangosearch.Article 1>, 1, 1, None, 0)
+>>> import pickle
+>>> pickle.loads(pickle.dumps(hit)) == hit
+True
+
+# Results and counts can be fetched in the background.
+
+>>> results = search('article')
+>>> raw, count = results[:2].araw(), results.acount()
+>>> raw.result(), count.result()
+([<Hit: djangosearch.Article 1>, <Hit: djangosearch.Article 2>], 250)
+>>> sorted(results.engine.requests)
+['count', 'results 0:2']
+
+>>> results = search('article')
+>>> results.prefetch()
+>>> [obj.title for obj in results[2:4]], [obj.title for obj in results[1:2]]
+([u'article 2', u'article 3'], [u'article 1'])
+>>> results.engine.requests
+['results 0:100']
+
+# If fetching in the background fails, the results are fetched again when
+# they are used.
+
+>>> results = search('article')
+>>> def fail(query):
+...     results.engine.requests.append('failed')
+...     raise IOError('Search engine unavailable')
+>>> results.engine.get_results = fail
+>>> results.prefetch()
+>>> wait_for(lambda: results.engine.requests)
+>>> del results.engine.get_results
+>>> [obj.title for obj in results[:2]], [obj.title for obj in results[2:3]]
+([u'article 0', u'article 1'], [u'article 2'])
+>>> results.engine.requests
+['failed', 'results 0:2', 'results 2:3']
+
+# Iterating fetches the results a chunk at a time, and stopping early doesn't
+# fetch the rest.
+
+>>> results = search('article')
+>>> for obj in results:
+...     if obj.title == 'article 150':
+...         break
+>>> results.engine.requests
+['results 0:100', 'results 100:200']
+>>> results[160]
+<Article: article 160>
+>>> len(list(results)), len(results)
+(250, 250)
+>>> results.engine.requests
+['results 0:100', 'results 100:200', 'count', 'results 200:300']
+
+>>> results = search('article')[:5]
+>>> results
+[<Article: article 0>, <Article: article 1>, <Article: article 2>, <Article: article 3>, <Article: article 4>]
+>>> results.count()
+5
+>>> results.engine.requests
+['results 0:5']
+
+# Getting results by index fetches the chunk of results around them, which
+# is used for the results near them.
+
+>>> results = search('article')
+>>> results[0], results[1], results[99], results[150]
+(<Article: article 0>, <Article: article 1>, <Article: article 99>, <Article: article 150>)
+>>> results[10:12][1], results[151:153][0]
+(<Article: article 11>, <Article: article 151>)
+>>> results.engine.requests
+['results 0:100', 'results 100:200']
+
+# iterator() streams the results without caching them.
+
+>>> results = search('article')
+>>> len([obj for obj in results.iterator(chunk_size=120)])
+250
+>>> results.engine.requests
+['results 0:120', 'results 120:240', 'results 240:360']
+>>> print results._result_cache, results._raw_cache
+None None
+
+# Pages that come up short because objects were deleted after they were
+# indexed are filled with the hits that follow them.
+
+>>> Article.objects.filter(title__in=['article 3', 'article 5', 'article 10']).delete()
+>>> results = search('article')[:10]
+>>> [obj.title for obj in results]
+[u'article 0', u'article 1', u'article 2', u'article 4', u'article 6', u'article 7', u'article 8', u'article 9', u'article 11', u'article 12']
+>>> results.engine.requests
+['results 0:10', 'results 10:12', 'results 12:13']
+
+# With SEARCH_REMOVE_DELETED, the deleted objects are also removed from the
+# index, a model at a time and in the background.
+
+>>> from djangosearch import results as results_module
+>>> results_module.REMOVE_DELETED = True
+>>> Article.index._engine = engine = RecordingEngine()
+>>> results = search('article')[:10]
+>>> len(list(results.iterator()))
+10
+>>> wait_for(lambda: len(engine.requests) == 2)
+>>> sorted(engine.requests)
+['remove 11', 'remove 4, 6']
+>>> Article.index._engine = False
+>>> results_module.REMOVE_DELETED = False
+
+# With SEARCH_CONCURRENT_LOADING, objects are still loaded one model after
+# another inside a transaction, as other connections can't see what it
+# hasn't committed yet. (Loading from another connection here would fail, as
+# the database the settings now point to has no tables.)
+
+>>> from django.conf import settings
+>>> from django.db import transaction
+>>> from djangosearch.results import Hit
+>>> from djangosearch.tests import Event
+>>> database_name = settings.DATABASE_NAME
+>>> settings.DATABASE_NAME = os.path.join(tempfile.gettempdir(), 'empty.db')
+>>> results_module.CONCURRENT_LOADING = True
+>>> Event.index._engine = False
+>>> transaction.enter_transaction_management()
+>>> transaction.managed(True)
+>>> a = Article.objects.create(title='uncommitted', date=datetime(2008, 1, 1))
+>>> e = Event.objects.create(title='uncommitted', date=datetime(2008, 1, 1))
+>>> search('article')._load_objects([Hit(Article, a.pk), Hit(Event, e.pk)])
+[<Article: uncommitted>, <Event: uncommitted>]
+>>> transaction.rollback()
+>>> transaction.leave_transaction_management()
+>>> results_module.CONCURRENT_LOADING = False
+>>> Event.index._engine = None
+>>> settings.DATABASE_NAME = database_name
+
+# values() and values_list() use the fields stored in the index instead of
+# loading the objects from the database.
+
+>>> from django.db import connection
+>>> settings.DEBUG, connection.queries = True, []
+>>> sorted(search('article').values('title')[0].items())
+[('model', <class 'djangosearch.tests.Article'>), ('pk', 1), ('relevance', None), ('title', u'article 0')]
+>>> search('article').values_list('pk', 'title')[1:3]
+[(2, u'article 1'), (3, u'article 2')]
+>>> search('article').values_list('title', flat=True)[:2]
+[u'article 0', u'article 1']
+>>> search('article').values_list()[0]
+(<class 'djangosearch.tests.Article'>, 1, None)
+>>> connection.queries
+[]
+
+# only(), defer() and select_related() are passed on to the QuerySets that
+# load the objects.
+
+>>> obj = search('article').only('title', 'nonexistent')[0]
+>>> len(connection.queries), obj._deferred, obj.title
+(1, True, u'article 0')
+>>> obj = search('article').defer('title').select_related()[1]
+>>> obj._deferred, obj.title
+(True, u'article 1')
+>>> settings.DEBUG = False
+
+# With SEARCH_RESULTS_CACHE_TIMEOUT, results are cached between requests until
+# the index is changed.
+
+>>> from djangosearch import caching
+>>> caching.TIMEOUT = 60
+>>> results = search('article')[:2]
+>>> [obj.title for obj in results], results.engine.requests
+([u'article 0', u'article 1'], ['results 0:2'])
+>>> results = search('article  article')[:2]
+>>> [obj.title for obj in results], results.engine.requests
+([u'article 0', u'article 1'], [])
+>>> results = search('article')[2:4]
+>>> [obj.title for obj in results], results.engine.requests
+([u'article 2', u'article 4'], ['results 2:4', 'results 4:5'])
+
+>>> Article.index._engine = RecordingEngine()
+>>> Article.index.remove_object(Article.objects.get(title='article 0'))
+>>> Article.index._engine = False
+>>> results = search('article')[:2]
+>>> [obj.title for obj in results], results.engine.requests
+([u'article 0', u'article 1'], ['results 0:2'])
+>>> search('article').count(), search('article').count(approximate=True)
+(250, 250)
+>>> Article.index._engine = RecordingEngine()
+>>> Article.index.remove_object(Article.objects.get(title='article 1'))
+>>> Article.index._engine = False
+>>> RecordingEngine.indexed.pop(0)['title']
+u'article 0'
+
+# Approximate counts are cached even when the index changes.
+
+>>> results = search('article')
+>>> results.count(approximate=True), results.count(), results.engine.requests
+(250, 249, ['count'])
+>>> caching.TIMEOUT = 0
+
+# With SEARCH_PREFETCH_NEXT_PAGE, fetching a page starts fetching the next
+# one into the results cache.
+
+>>> from djangosearch import results as results_module
+>>> caching.TIMEOUT, results_module.PREFETCH_NEXT_PAGE = 60, True
+>>> page = search('article')[100:110]
+>>> [obj.title for obj in page][0]
+u'article 101'
+>>> next = SearchQuery('article').clone(low_mark=110, high_mark=120)
+>>> wait_for(lambda: caching.get_results(next) is not None)
+>>> sorted(page.engine.requests)
+['results 100:110', 'results 110:120']
+>>> page = search('article')[110:120]
+>>> [obj.title for obj in page][0]
+u'article 111'
+>>> wait_for(lambda: page.engine.requests)
+>>> results_module.prefetch_stats
+<PrefetchStats: 2 started, 0 dropped, 1 used>
+>>> sorted(page.engine.requests)
+['results 120:130']
+
+# Getting results by index doesn't prefetch anything.
+
+>>> results = search('article')
+>>> [results[i].title for i in range(5)][-1]
+u'article 6'
+>>> results.engine.requests
+['results 0:100']
+>>> results_module.prefetch_stats
+<PrefetchStats: 2 started, 0 dropped, 1 used>
+>>> caching.TIMEOUT, results_module.PREFETCH_NEXT_PAGE = 0, False
+
+>>> Article.index._engine = None
+
+"""
+
+import time
+
+from djangosearch.backends import BaseSearchEngine
+from djangosearch.results import Hit
+
+class RecordingEngine(BaseSearchEngine):
+    # The stored fields of the indexed articles.
+    indexed = []
+
+    def __init__(self):
+        self.requests = []
+
+    def _results(self, query):
+        from djangosearch.tests import Article
+        results = []
+        for stored in self.indexed:
+            fields = None
+            if query.fields is not None:
+                fields = dict([(name, stored.get(name))
+                               for name in query.fields])
+            results.append(Hit(Article, unicode(stored['pk']), None, fields))
+        return results
+
+    def get_results(self, query):
+        high = query.high_mark
+        self.requests.append('results %s:%s' % (query.low_mark, high))
+        return self._results(query)[query.low_mark:high]
+
+    def get_count(self, query):
+        if query.high_mark is not None or query.low_mark:
+            raise NotImplementedError
+        self.requests.append('count')
+        return len(self._results(query))
+
+    def update(self, indexer, iterable):
+        self.requests.append('update %s' % ', '.join([obj.title 
+                                                      for obj in iterable]))
+
+    def remove(self, obj):
+        self.requests.append('remove %s' % obj.pk)
+
+    def remove_many(self, objs):
+        self.requests.append('remove %s' % ', '.join([str(obj.pk) 
+                                                      for obj in objs]))
+
+def wait_for(condition, timeout=5):
+    """Waits for something to happen in the background."""
+    start = time.time()
+    while not condition():
+        if time.time() - start > timeout:
+            raise AssertionError('Timed out')
+        time.sleep(0.01)
@@ -3,5 +3,19 @@
 >>> from djangosearch.backends.solr import QueryConverter
 
 >>> convert('(video or pictures) -(sports news) "train times" foo -boring title:foo', QueryConverter)
-'(video pictures) AND NOT (sports AND news) AND "train times" AND foo AND NOT boring AND title:foo'
+'title:foo AND (video pictures) AND NOT (sports AND news) AND "train times" AND foo AND NOT boring'
+
+# Redundant parts of the query are optimized away before conversion.
+>>> convert('((django django) or django) -(-(web or (framework or web))) (python)', QueryConverter)
+'django AND (web framework) AND python'
+
+# Characters with special meanings in Solr are escaped, so that they match
+# literally: "what?" isn't a wildcard query, and "now!" or "x/y" aren't
+# syntax errors.
+>>> print convert('what? now! x/y a-b -(a&b)', QueryConverter)
+what\\? AND now\\! AND x\\/y AND a\\-b AND NOT a\\&b
+
+# Prefixes are compiled to Solr prefix queries.
+>>> print convert('djan* -foo? title:web* dj?n*', QueryConverter)
+title:web* AND djan* AND NOT foo\\? AND dj\\?n*
 """
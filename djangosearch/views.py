@@ -1,11 +1,13 @@
 from django.db import models
 from django.conf import settings
 from django.core.paginator import Paginator
+from django.http import Http404
 from django.shortcuts import render_to_response
 from django.template import RequestContext
 from django import forms
 import djangosearch
 from djangosearch.indexer import get_indexed_models
+from djangosearch.query import ParseError, QueryTooComplex, parse_tree
 
 RESULTS_PER_PAGE = getattr(settings, 'SEARCH_RESULTS_PER_PAGE', 20)
 
@@ -16,6 +18,20 @@ class ModelSearchForm(forms.Form):
     query = forms.CharField(required=False)
     models = forms.MultipleChoiceField(choices=model_choices(), required=False,
         widget=forms.CheckboxSelectMultiple)
+
+    def clean_query(self):
+        query = self.cleaned_data['query']
+        # parse_tree() checks the cost of the query as well as the limits
+        # check_query() does, and caches it for the search.
+        try:
+            parse_tree(query)
+        except QueryTooComplex, e:
+            raise forms.ValidationError(unicode(e))
+        except ParseError:
+            # Left to the backend, as it was before these checks.
+            pass
+        return query
+
     def get_models(self):
         """Return a list of model classes specified by the models field."""
         search_models = []
@@ -30,7 +46,17 @@ class ModelSearchForm(forms.Form):
 def search(request, template='search/search.html'):
     form = ModelSearchForm(request.GET)
     if not form.is_valid():
-        raise Exception(form.errors)
+        # Such as a query over the SEARCH_MAX_QUERY_* limits; show the form
+        # again with its errors, without searching.
+        context = RequestContext(request, {
+            'query': request.GET.get('query', ''),
+            'form': form,
+            'page': None,
+            'paginator': None,
+        })
+        response = render_to_response(template, context_instance=context)
+        response.status_code = 400
+        return response
     query = form.cleaned_data['query']
     search_models = form.get_models()
     try: